@@ -0,0 +1,362 @@
+"""Offline load test for the API hot paths.
+
+Runs the FastAPI app in-process against a seeded database, with the fake payment
+gateway and a null email transport, drives the hot routes concurrently and reports
+throughput and latency percentiles per route. Results can be saved as a baseline
+and later runs fail when a route regresses past the threshold.
+
+    # Harness dependencies (httpx, mongomock-motor) are not in the production requirements
+    pip install -r requirements-dev.txt
+
+    # In-memory Mongo stand-in, tiny data set
+    python benchmarks/api_bench.py --mongo-url memory --scale tiny
+
+    # Local mongod with the full data set (10k messes, 100k students, 1M ratings and skips)
+    python benchmarks/api_bench.py --mongo-url mongodb://localhost:27017 --scale full --save-baseline baseline.json
+    python benchmarks/api_bench.py --mongo-url mongodb://localhost:27017 --scale full --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+WEEKLY_MENU = [{'day': day, 'breakfast': 'Poha', 'lunch': 'Thali', 'dinner': 'Roti Sabzi'}
+               for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')]
+SCALES = {
+    'tiny': {'messes': 50, 'students': 500, 'ratings': 2500, 'skips': 1500},
+    'small': {'messes': 200, 'students': 2000, 'ratings': 20000, 'skips': 20000},
+    'full': {'messes': 10000, 'students': 100000, 'ratings': 1000000, 'skips': 1000000},
+}
+CITIES = [
+    ('Pune', 'Maharashtra'), ('Mumbai', 'Maharashtra'), ('Nagpur', 'Maharashtra'),
+    ('Bengaluru', 'Karnataka'), ('Mysuru', 'Karnataka'), ('Chennai', 'Tamil Nadu'),
+    ('Coimbatore', 'Tamil Nadu'), ('Hyderabad', 'Telangana'), ('Delhi', 'Delhi'),
+    ('Kolkata', 'West Bengal'), ('Jaipur', 'Rajasthan'), ('Kota', 'Rajasthan'),
+    ('Indore', 'Madhya Pradesh'), ('Bhopal', 'Madhya Pradesh'), ('Lucknow', 'Uttar Pradesh'),
+    ('Ahmedabad', 'Gujarat'), ('Chandigarh', 'Chandigarh'), ('Kochi', 'Kerala'),
+]
+MEALS = ('breakfast', 'lunch', 'dinner')
+PASSWORD = 'bench-password'
+CHUNK = 5000
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def configure_environment(args):
+    # Must run before server is imported: it reads its configuration at import time
+    os.environ['MONGO_URL'] = args.mongo_url if args.mongo_url != 'memory' else 'mongodb://localhost:27017'
+    os.environ['DB_NAME'] = args.db_name
+    os.environ['PAYMENT_GATEWAY'] = 'fake'
+    os.environ['EMAIL_TRANSPORT'] = 'file'
+    os.environ['EMAIL_OUTBOX_FILE'] = os.devnull
+    os.environ['EMAIL_WORKER_ENABLED'] = 'false'
+    os.environ['SUBSCRIPTION_SWEEP_ENABLED'] = 'false'
+    # Every simulated login comes from one client address; measure capacity, not the limiter
+    os.environ.setdefault('RATE_LIMIT_LOGIN_IP', '1000000/second')
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def load_server(args):
+    configure_environment(args)
+    import server
+    if args.mongo_url == 'memory':
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--mongo-url memory needs mongomock-motor (pip install mongomock-motor)")
+        server.client = AsyncMongoMockClient(tz_aware=True)
+        server.db = server.client[args.db_name]
+    return server
+
+
+async def insert_chunked(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == CHUNK:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(server, scale_name, rng, create_indexes=True):
+    db = server.db
+    scale = SCALES[scale_name]
+    meta = await db.bench_meta.find_one({'_id': 'seed'})
+    if meta and meta.get('scale') == scale_name:
+        print(f"Reusing seeded '{scale_name}' data set")
+        return meta['fixture']
+
+    print(f"Seeding '{scale_name}' data set: {scale}")
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+    if create_indexes:
+        await server.ensure_indexes()
+
+    now = datetime.now(timezone.utc)
+    password_hash = server._hashpw(PASSWORD)
+    owner_count = max(1, scale['messes'] // 5)
+    owners = [str(uuid.uuid4()) for _ in range(owner_count)]
+    students = [str(uuid.uuid4()) for _ in range(scale['students'])]
+    admin_id = str(uuid.uuid4())
+
+    def users():
+        yield {'id': admin_id, 'name': 'Bench Admin', 'email': 'admin@bench.smartmess.com', 'role': 'admin',
+               'password': password_hash, 'is_verified': True, 'created_at': now.isoformat()}
+        for index, owner_id in enumerate(owners):
+            yield {'id': owner_id, 'name': f'Owner {index}', 'email': f'owner{index}@bench.smartmess.com', 'role': 'owner',
+                   'password': password_hash, 'is_verified': True,
+                   'created_at': (now - timedelta(minutes=index)).isoformat()}
+        for index, student_id in enumerate(students):
+            yield {'id': student_id, 'name': f'Student {index}', 'email': f'student{index}@bench.smartmess.com', 'role': 'student',
+                   'password': password_hash, 'is_verified': True,
+                   'created_at': (now - timedelta(seconds=index)).isoformat()}
+    await insert_chunked(db.users, users())
+
+    # Ratings are generated per mess so each mess carries matching counters
+    ratings_per_mess = scale['ratings'] // scale['messes']
+    mess_ids = [str(uuid.uuid4()) for _ in range(scale['messes'])]
+    messes = []
+    ratings = []
+    for index, mess_id in enumerate(mess_ids):
+        city, state = CITIES[index % len(CITIES)]
+        values = [rng.randint(1, 5) for _ in range(ratings_per_mess)]
+        for value in values:
+            student_index = rng.randrange(len(students))
+            ratings.append({'id': str(uuid.uuid4()), 'mess_id': mess_id, 'rating': float(value), 'review': None,
+                            'student_id': students[student_index], 'student_name': f'Student {student_index}',
+                            'created_at': now.isoformat()})
+        monthly = float(rng.randrange(1800, 4500, 50))
+        messes.append({
+            'id': mess_id, 'owner_id': owners[index % owner_count], 'name': f'Mess {index}',
+            'address': f'{index} Main Road', 'city': city, 'state': state,
+            'city_key': server.normalize_location(city), 'state_key': server.normalize_location(state),
+            'mess_type': 'both', 'description': None, 'contact_number': '9000000000',
+            'pricing_monthly': monthly, 'pricing_weekly': round(monthly / 4),
+            'menu_version': 1,
+            'rating_sum': float(sum(values)), 'total_ratings': len(values),
+            'rating': sum(values) / len(values) if values else 0.0,
+            'is_verified': index % 10 != 0, 'created_at': (now - timedelta(minutes=index)).isoformat()
+        })
+        if len(ratings) >= CHUNK:
+            await db.ratings.insert_many(ratings, ordered=False)
+            ratings = []
+    if ratings:
+        await db.ratings.insert_many(ratings, ordered=False)
+    await insert_chunked(db.messes, messes)
+    await insert_chunked(db.menus, [
+        {'id': str(uuid.uuid4()), 'mess_id': mess['id'], 'version': 1, 'menu': WEEKLY_MENU,
+         'created_by': mess['owner_id'], 'created_at': now.isoformat()}
+        for mess in messes
+    ])
+
+    # One current subscription per student
+    start = now - timedelta(days=3)
+    subscriptions = []
+    for index, student_id in enumerate(students):
+        plan = 'monthly' if index % 3 else 'weekly'
+        subscriptions.append({
+            'id': str(uuid.uuid4()), 'student_id': student_id, 'mess_id': mess_ids[index % len(mess_ids)],
+            'plan_type': plan, 'start_date': start, 'end_date': start + timedelta(days=30 if plan == 'monthly' else 7),
+            'status': 'active', 'payment_id': f'pay_bench_{index}', 'order_id': f'order_bench_{index}',
+            'created_at': start.isoformat()
+        })
+    await insert_chunked(db.subscriptions, subscriptions)
+
+    def skips():
+        # Walks subscriptions, then meals, then days so every (subscription, day, meal) is distinct
+        count = len(subscriptions)
+        for index in range(scale['skips']):
+            sub = subscriptions[index % count]
+            meal = MEALS[(index // count) % 3]
+            day = (start + timedelta(days=4 + index // (3 * count))).astimezone(server.MESS_TIMEZONE)
+            yield {'id': str(uuid.uuid4()), 'subscription_id': sub['id'], 'student_id': sub['student_id'],
+                   'mess_id': sub['mess_id'], 'skip_date': day.isoformat(), 'skip_day': day.date().isoformat(),
+                   'meal_type': meal, 'created_at': now.isoformat()}
+    await insert_chunked(db.meal_skips, skips())
+
+    complaints = [{
+        'id': str(uuid.uuid4()), 'mess_id': mess_ids[index % len(mess_ids)], 'student_id': students[index],
+        'student_name': f'Student {index}', 'subject': 'Food quality', 'description': 'Cold dinner',
+        'status': 'pending' if index % 2 else 'resolved', 'created_at': (now - timedelta(hours=index)).isoformat(),
+        'resolved_at': None
+    } for index in range(min(len(students), scale['messes']))]
+    await insert_chunked(db.complaints, complaints)
+
+    await server.rebuild_owner_stats()
+    await server.rebuild_meal_headcounts()
+    await server.rebuild_mess_rollups()
+
+    fixture = {'admin_id': admin_id, 'owners': owners[:1000], 'students': students[:5000], 'mess_ids': mess_ids[:5000]}
+    await db.bench_meta.replace_one({'_id': 'seed'}, {'_id': 'seed', 'scale': scale_name, 'fixture': fixture}, upsert=True)
+    return fixture
+
+
+def build_scenarios(server, fixture, rng):
+    students = fixture['students']
+    owners = fixture['owners']
+    admin_token = server.create_token(fixture['admin_id'], 'admin')
+    student_tokens = {}
+    owner_tokens = {}
+
+    def student_auth():
+        student_id = rng.choice(students)
+        token = student_tokens.setdefault(student_id, server.create_token(student_id, 'student'))
+        return {'Authorization': f'Bearer {token}'}
+
+    def owner_auth():
+        owner_id = rng.choice(owners)
+        token = owner_tokens.setdefault(owner_id, server.create_token(owner_id, 'owner'))
+        return {'Authorization': f'Bearer {token}'}
+
+    def login():
+        index = rng.randrange(len(students))
+        return 'POST', '/api/auth/login', {'json': {'email': f'student{index}@bench.smartmess.com', 'password': PASSWORD}}
+
+    def search():
+        city, _ = rng.choice(CITIES)
+        return 'GET', '/api/mess/search', {'params': {'city': city, 'sort': rng.choice(['rating', 'price']), 'limit': 20}}
+
+    def my_subscriptions():
+        return 'GET', '/api/subscription/my-subscriptions', {'headers': student_auth()}
+
+    def rating():
+        body = {'mess_id': rng.choice(fixture['mess_ids']), 'rating': float(rng.randint(1, 5)), 'review': 'bench'}
+        return 'POST', '/api/rating', {'json': body, 'headers': student_auth()}
+
+    def dashboard_stats():
+        return 'GET', '/api/owner/dashboard-stats', {'headers': owner_auth()}
+
+    def admin_users():
+        return 'GET', '/api/admin/users', {'params': {'limit': 100}, 'headers': {'Authorization': f'Bearer {admin_token}'}}
+
+    def admin_complaints():
+        return 'GET', '/api/admin/complaints', {'params': {'limit': 100, 'status': 'pending'},
+                                                'headers': {'Authorization': f'Bearer {admin_token}'}}
+
+    return {
+        'login': login,
+        'search': search,
+        'my_subscriptions': my_subscriptions,
+        'rating': rating,
+        'dashboard_stats': dashboard_stats,
+        'admin_users': admin_users,
+        'admin_complaints': admin_complaints,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_scenario(http, make_request, requests_total, concurrency):
+    latencies = []
+    errors = 0
+    remaining = requests_total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            response = await http.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': statistics.fmean(latencies),
+    }
+
+
+def compare(results, baseline, threshold):
+    # A route regresses when p95 grows or throughput drops by more than the threshold
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['throughput_rps'] < base['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.0f} -> {result['throughput_rps']:.0f} req/s")
+    return regressions
+
+
+async def main_async(args):
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("The benchmark needs httpx (pip install httpx)")
+    server = load_server(args)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    # The in-memory stand-in scans regardless of indexes, and maintaining them only slows seeding
+    fixture = await seed(server, args.scale, rng, create_indexes=args.mongo_url != 'memory')
+    scenarios = build_scenarios(server, fixture, rng)
+    selected = args.routes.split(',') if args.routes else list(scenarios)
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as http:
+        for name in selected:
+            # Warm caches and connection pools before measuring
+            await run_scenario(http, scenarios[name], min(20, args.requests), args.concurrency)
+            results[name] = await run_scenario(http, scenarios[name], args.requests, args.concurrency)
+            result = results[name]
+            print(f"{name:18} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f}ms  "
+                  f"p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms  errors {result['errors']}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'memory'),
+                        help="MongoDB URL, or 'memory' for the in-memory stand-in")
+    parser.add_argument('--db-name', default='smart_mess_bench')
+    parser.add_argument('--scale', choices=list(SCALES), default='tiny')
+    parser.add_argument('--routes', help='comma-separated subset of routes to run')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--baseline', help='fail if results regress against this JSON file')
+    parser.add_argument('--save-baseline', help='write results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression, as a fraction')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == '__main__':
+    main()
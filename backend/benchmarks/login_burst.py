@@ -0,0 +1,122 @@
+"""Measure read latency on GET /api/mess/{id} while a burst of logins runs.
+
+Run it against a live backend once on the old code and once on the new code:
+
+    python benchmarks/login_burst.py --base-url http://localhost:8001 --label before --out before.json
+    python benchmarks/login_burst.py --base-url http://localhost:8001 --label after --compare before.json
+
+All logins come from one address, so start the backend with the login rate limits
+raised (e.g. RATE_LIMIT_LOGIN_IP=100000/second RATE_LIMIT_LOGIN_EMAIL=100000/second),
+otherwise most of the burst is answered with 429 before reaching bcrypt.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'mean_ms': statistics.fmean(samples),
+    }
+
+
+def find_mess_id(api):
+    messes = requests.get(f"{api}/mess/search", params={'limit': 1}, timeout=10).json()
+    if not messes:
+        raise SystemExit("No verified mess found; pass --mess-id")
+    return messes[0]['id']
+
+
+def run(args):
+    api = args.base_url.rstrip('/') + '/api'
+    mess_id = args.mess_id or find_mess_id(api)
+
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    password = 'bench-password'
+    signup = requests.post(f"{api}/auth/signup", json={
+        'name': 'Benchmark', 'email': email, 'password': password, 'role': 'student'
+    }, timeout=30)
+    signup.raise_for_status()
+
+    stop = threading.Event()
+    read_latencies = []
+    login_count = [0]
+    lock = threading.Lock()
+
+    def login_worker():
+        session = requests.Session()
+        while not stop.is_set():
+            session.post(f"{api}/auth/login", json={'email': email, 'password': password}, timeout=60)
+            with lock:
+                login_count[0] += 1
+
+    def read_worker():
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            session.get(f"{api}/mess/{mess_id}", timeout=60)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                read_latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=args.logins + args.readers) as pool:
+        for _ in range(args.logins):
+            pool.submit(login_worker)
+        for _ in range(args.readers):
+            pool.submit(read_worker)
+        time.sleep(args.duration)
+        stop.set()
+
+    result = {
+        'label': args.label,
+        'concurrent_logins': args.logins,
+        'logins_per_sec': login_count[0] / args.duration,
+        'mess_reads': summarize(read_latencies),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--mess-id')
+    parser.add_argument('--logins', type=int, default=16, help='concurrent login clients')
+    parser.add_argument('--readers', type=int, default=4, help='concurrent mess readers')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run')
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--out', help='write the result as JSON')
+    parser.add_argument('--compare', help='JSON result of an earlier run to compare against')
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            before = baseline['mess_reads'][key]
+            after = result['mess_reads'][key]
+            print(f"{key}: {baseline['label']} {before:.1f} -> {result['label']} {after:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,126 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks, Query, Request, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import re
+import asyncio
+import json
+import base64
+import io
+import csv
+import hmac
+import hashlib
+import functools
 import logging
+import time
+import bisect
+import math
+import contextvars
+import threading
+import socket
+import smtplib
+from email.message import EmailMessage
+from collections import OrderedDict
+from email.utils import formatdate
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 import jwt
 import razorpay
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+import requests
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Request Metrics
+# The HTTP middleware records per-route latency histograms and in-flight counts, and
+# pymongo command monitoring counts MongoDB commands and their time. Commands are
+# attributed to the request that issued them through a context variable (Motor copies
+# the context into its executor threads), so N+1 query patterns show up per route.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_MS', '1000')) / 1000
+request_queries = contextvars.ContextVar('request_queries', default=None)
+
+class Histogram:
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestMetrics:
+    # Command callbacks arrive on Motor's executor threads, so updates take the lock
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> Histogram
+        self.route_db = {}  # (method, route) -> [commands, seconds]
+        self.commands = {}  # command name -> [count, seconds, failures]
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, queries: dict):
+        with self.lock:
+            key = (method, route)
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            self.latency.setdefault(key, Histogram()).observe(seconds)
+            db_totals = self.route_db.setdefault(key, [0, 0.0])
+            db_totals[0] += queries['count']
+            db_totals[1] += queries['seconds']
+
+    def record_command(self, name: str, seconds: float, failed: bool):
+        queries = request_queries.get()
+        with self.lock:
+            totals = self.commands.setdefault(name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += failed
+            if queries is not None:
+                queries['seconds'] += seconds
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        queries = request_queries.get()
+        if queries is None:
+            return
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get('collection', '')
+        label = f"{event.command_name} {target}".strip()
+        with metrics.lock:
+            queries['count'] += 1
+            queries['commands'][label] = queries['commands'].get(label, 0) + 1
+
+    def succeeded(self, event):
+        metrics.record_command(event.command_name, event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        metrics.record_command(event.command_name, event.duration_micros / 1e6, True)
+
+metrics = RequestMetrics()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app
-app = FastAPI()
+# orjson encodes responses several times faster than the stdlib encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # JWT Configuration
@@ -35,19 +130,318 @@ JWT_ALGORITHM = "HS256"
 # Security
 security = HTTPBearer()
 
-# Razorpay Client
-razorpay_client = razorpay.Client(auth=(os.environ.get('RAZORPAY_KEY_ID', ''), os.environ.get('RAZORPAY_KEY_SECRET', '')))
+# Payment Gateway
+PAYMENT_TIMEOUT_SECONDS = float(os.environ.get('PAYMENT_TIMEOUT_SECONDS', '10'))
+
+def razorpay_signature(key_secret: str, order_id: str, payment_id: str) -> str:
+    # Razorpay signs "<order_id>|<payment_id>" with HMAC-SHA256 of the key secret
+    return hmac.new(key_secret.encode('utf-8'), f"{order_id}|{payment_id}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+class RazorpayGateway:
+    def __init__(self, key_id: str, key_secret: str):
+        # The SDK keeps one requests.Session, so connections are pooled across calls
+        self.client = razorpay.Client(auth=(key_id, key_secret))
+        self.key_secret = key_secret
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('PAYMENT_MAX_WORKERS', '8')),
+            thread_name_prefix='razorpay'
+        )
+
+    async def create_order(self, amount_paise: int) -> dict:
+        call = functools.partial(
+            self.client.order.create,
+            {'amount': amount_paise, 'currency': 'INR', 'payment_capture': 1},
+            timeout=PAYMENT_TIMEOUT_SECONDS
+        )
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(self.executor, call),
+            PAYMENT_TIMEOUT_SECONDS + 1
+        )
+
+    def verify_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return hmac.compare_digest(razorpay_signature(self.key_secret, order_id, payment_id), signature)
+
+class FakeGateway:
+    # Offline stand-in: orders are minted locally, signatures use the real scheme
+    def __init__(self, key_secret: str = 'fake_secret'):
+        self.key_secret = key_secret
+
+    async def create_order(self, amount_paise: int) -> dict:
+        return {'id': f"order_{uuid.uuid4().hex[:14]}", 'entity': 'order', 'amount': amount_paise, 'currency': 'INR', 'status': 'created'}
+
+    def verify_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return hmac.compare_digest(razorpay_signature(self.key_secret, order_id, payment_id), signature)
+
+    def sign(self, order_id: str, payment_id: str) -> str:
+        return razorpay_signature(self.key_secret, order_id, payment_id)
+
+if os.environ.get('PAYMENT_GATEWAY', 'razorpay') == 'fake':
+    payment_gateway = FakeGateway()
+else:
+    payment_gateway = RazorpayGateway(os.environ.get('RAZORPAY_KEY_ID', ''), os.environ.get('RAZORPAY_KEY_SECRET', ''))
 
 # SendGrid Client
 sendgrid_api_key = os.environ.get('SENDGRID_API_KEY', '')
 
-# Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# In-process caches
+class TTLCache:
+    # LRU-bounded map whose entries also expire after a TTL. Only touched from the
+    # event loop, so no locking. Each worker process has its own copy.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+# Authenticated users by id, and decoded JWT payloads by token
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('USER_CACHE_TTL', '60'))
+)
+token_cache = TTLCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')), ttl=300)
+
+def invalidate_user(user_id: str):
+    # Call after any write to a user document
+    user_cache.delete(user_id)
+
+# Response cache for public reads. Entries hold the serialized body plus validators:
+# {'body': bytes, 'etag': str, 'last_modified': str}
+class MemoryCacheBackend:
+    # Per worker; other workers see a write only once their entry's TTL runs out
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[dict]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, entry: dict):
+        self.cache.set(key, entry)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.cache.delete(key)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+class MongoCacheBackend:
+    # Shared by every worker; a TTL index on expires_at removes stale entries
+    def __init__(self, collection_name: str, ttl: float):
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        doc = await db[self.collection_name].find_one({'_id': key, 'expires_at': {'$gt': datetime.now(timezone.utc)}})
+        if not doc:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'body': bytes(doc['body']), 'etag': doc['etag'], 'last_modified': doc['last_modified']}
 
-def verify_password(password: str, hashed: str) -> bool:
+    async def set(self, key: str, entry: dict):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        await db[self.collection_name].replace_one({'_id': key}, {**entry, 'expires_at': expires_at}, upsert=True)
+
+    async def delete(self, *keys: str):
+        await db[self.collection_name].delete_many({'_id': {'$in': list(keys)}})
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
+if os.environ.get('RESPONSE_CACHE_BACKEND', 'memory') == 'mongo':
+    response_cache = MongoCacheBackend('response_cache', RESPONSE_CACHE_TTL)
+else:
+    response_cache = MemoryCacheBackend(int(os.environ.get('RESPONSE_CACHE_SIZE', '1000')), RESPONSE_CACHE_TTL)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+async def cached_json_response(request: Request, key: str, loader) -> Response:
+    entry = await response_cache.get(key)
+    if entry is None:
+        body = json.dumps(await loader(), default=str).encode('utf-8')
+        entry = {
+            'body': body,
+            'etag': '"' + hashlib.sha1(body).hexdigest() + '"',
+            'last_modified': formatdate(time.time(), usegmt=True)
+        }
+        await response_cache.set(key, entry)
+    headers = {'ETag': entry['etag'], 'Last-Modified': entry['last_modified'], 'Cache-Control': 'no-cache'}
+    if _etag_matches(request.headers.get('if-none-match'), entry['etag']):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry['body'], media_type='application/json', headers=headers)
+
+async def invalidate_mess_responses(mess_id: str, ratings: bool = False):
+    keys = [f"mess:{mess_id}"]
+    if ratings:
+        keys.append(f"ratings:{mess_id}")
+    await response_cache.delete(*keys)
+
+# Password Hashing
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+# while bounding how many hashes run at once.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BCRYPT_MAX_WORKERS', '4')),
+    thread_name_prefix='bcrypt'
+)
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def _checkpw(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+# Rate Limiting
+# Token buckets checked by the auth routes before any bcrypt work is queued. A bucket
+# holds up to `capacity` tokens and refills at `rate` tokens per second; each request
+# takes one. Limits are written as "<count>/<second|minute|hour>".
+RATE_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+def parse_rate(value: str) -> tuple:
+    count, period = value.split('/')
+    return int(count), int(count) / RATE_PERIODS[period]
+
+RATE_LIMITS = {
+    'login_ip': parse_rate(os.environ.get('RATE_LIMIT_LOGIN_IP', '30/minute')),
+    'login_email': parse_rate(os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '10/minute')),
+    'signup_ip': parse_rate(os.environ.get('RATE_LIMIT_SIGNUP_IP', '10/minute')),
+}
+# With the backend behind N proxies, the client is the Nth address from the end of X-Forwarded-For
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
+
+class MemoryRateLimitBackend:
+    # Per worker, so the effective limit is multiplied by the number of workers.
+    # Only touched from the event loop; the LRU bound caps memory under IP churn.
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        # Returns 0 when a token was taken, else the seconds until one is available
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+class MongoRateLimitBackend:
+    # Shared by every worker: refill and take happen in one atomic pipeline update.
+    # A TTL index on expires_at drops buckets once they would be full again.
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        now = datetime.now(timezone.utc)
+        elapsed = {'$divide': [{'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}, 1000]}
+        pipeline = [
+            {'$set': {'tokens': {'$min': [capacity, {'$add': [{'$ifNull': ['$tokens', capacity]}, {'$multiply': [elapsed, rate]}]}]}}},
+            {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+            {'$set': {
+                'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                'updated_at': now,
+                'expires_at': now + timedelta(seconds=capacity / rate)
+            }},
+        ]
+        for attempt in range(2):
+            try:
+                bucket = await db[self.collection_name].find_one_and_update(
+                    {'_id': key}, pipeline, projection={'tokens': 1, 'allowed': 1},
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # Two first requests raced on the upsert; the retry updates the winner's bucket
+                if attempt:
+                    raise
+        return 0.0 if bucket['allowed'] else (1 - bucket['tokens']) / rate
+
+if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+    rate_limiter = MongoRateLimitBackend('rate_limits')
+else:
+    rate_limiter = MemoryRateLimitBackend(int(os.environ.get('RATE_LIMIT_MEMORY_SIZE', '100000')))
+rate_limit_stats = {name: {'allowed': 0, 'limited': 0} for name in RATE_LIMITS}
+
+def client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_COUNT:
+        forwarded = [hop.strip() for hop in request.headers.get('x-forwarded-for', '').split(',') if hop.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_COUNT:
+            return forwarded[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else 'unknown'
+
+async def enforce_rate_limits(*buckets: tuple):
+    # buckets are (limit name, key); stops at the first empty bucket
+    for name, key in buckets:
+        capacity, rate = RATE_LIMITS[name]
+        try:
+            wait = await rate_limiter.take(f"{name}:{key}", capacity, rate)
+        except Exception as e:
+            # Fail open: an unavailable shared backend must not lock everyone out
+            logger.warning(f"Rate limiter unavailable for {name}: {e}")
+            continue
+        if wait:
+            rate_limit_stats[name]['limited'] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please try again later",
+                headers={'Retry-After': str(math.ceil(wait))}
+            )
+        rate_limit_stats[name]['allowed'] += 1
+
+# Helper Functions
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, _hashpw, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, _checkpw, password, hashed)
+
+def password_needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$12$<salt+hash>; the third field is the cost factor
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def rehash_password(user_id: str, password: str, old_hash: str):
+    new_hash = await hash_password(password)
+    # Only replace the hash we verified against, in case the password changed meanwhile
+    await db.users.update_one({'id': user_id, 'password': old_hash}, {'$set': {'password': new_hash}})
+    invalidate_user(user_id)
+
 def create_token(user_id: str, role: str) -> str:
     payload = {
         'user_id': user_id,
@@ -59,31 +453,917 @@ def create_token(user_id: str, role: str) -> str:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({'id': payload['user_id']}, {'_id': 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = token_cache.get(token)
+        if payload is None:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            # Never keep a payload cached past its own expiry
+            token_cache.set(token, payload, ttl=min(token_cache.ttl, payload['exp'] - time.time()))
+        user = user_cache.get(payload['user_id'])
+        if user is None:
+            user = await db.users.find_one({'id': payload['user_id']}, {'_id': 0, 'password': 0})
+            if not user:
+                raise HTTPException(status_code=401, detail="User not found")
+            user_cache.set(user['id'], user)
+        # Routes may mutate the dict they get; hand out a copy of the cached one
+        return dict(user)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def send_email(to_email: str, subject: str, content: str):
-    if not sendgrid_api_key:
-        print(f"Email would be sent to {to_email}: {subject}")
+# Email Outbox
+# Routes enqueue into the email_outbox collection; run_email_worker() drains it in
+# batches through one long-lived transport, retrying failures with backoff.
+SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'noreply@smartmess.com')
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', '50'))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BASE_SECONDS = 30
+EMAIL_POLL_SECONDS = float(os.environ.get('EMAIL_POLL_SECONDS', '5'))
+EMAIL_LEASE_SECONDS = 300
+
+# Transports take a batch of outbox documents and return {outbox id: error} for failures
+class SendGridTransport:
+    url = 'https://api.sendgrid.com/v3/mail/send'
+
+    def __init__(self, api_key: str):
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+
+    def send_batch(self, messages: List[dict]) -> dict:
+        # Identical subject and body go out as one request with a personalization per recipient
+        groups = {}
+        for message in messages:
+            groups.setdefault((message['subject'], message['content']), []).append(message)
+        errors = {}
+        for (subject, content), group in groups.items():
+            body = {
+                'personalizations': [{'to': [{'email': message['to']}]} for message in group],
+                'from': {'email': SENDER_EMAIL},
+                'subject': subject,
+                'content': [{'type': 'text/html', 'value': content}]
+            }
+            try:
+                self.session.post(self.url, json=body, timeout=10).raise_for_status()
+            except Exception as e:
+                errors.update({message['id']: str(e) for message in group})
+        return errors
+
+class SMTPTransport:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    def send_batch(self, messages: List[dict]) -> dict:
+        errors = {}
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+                for message in messages:
+                    email = EmailMessage()
+                    email['From'] = SENDER_EMAIL
+                    email['To'] = message['to']
+                    email['Subject'] = message['subject']
+                    email.set_content(message['content'], subtype='html')
+                    try:
+                        smtp.send_message(email)
+                    except Exception as e:
+                        errors[message['id']] = str(e)
+        except Exception as e:
+            errors.update({message['id']: str(e) for message in messages if message['id'] not in errors})
+        return errors
+
+class FileTransport:
+    def __init__(self, path: str):
+        self.path = path
+
+    def send_batch(self, messages: List[dict]) -> dict:
+        with open(self.path, 'a') as f:
+            for message in messages:
+                f.write(json.dumps({key: message[key] for key in ('id', 'to', 'subject', 'content')}) + '\n')
+        return {}
+
+class LogTransport:
+    def send_batch(self, messages: List[dict]) -> dict:
+        for message in messages:
+            logger.info(f"Email would be sent to {message['to']}: {message['subject']}")
+        return {}
+
+def build_email_transport():
+    transport = os.environ.get('EMAIL_TRANSPORT') or ('sendgrid' if sendgrid_api_key else 'log')
+    if transport == 'sendgrid':
+        return SendGridTransport(sendgrid_api_key)
+    if transport == 'smtp':
+        return SMTPTransport(os.environ.get('SMTP_HOST', 'localhost'), int(os.environ.get('SMTP_PORT', '1025')))
+    if transport == 'file':
+        return FileTransport(os.environ.get('EMAIL_OUTBOX_FILE', str(ROOT_DIR / 'email_outbox.jsonl')))
+    return LogTransport()
+
+email_transport = build_email_transport()
+email_wakeup = asyncio.Event()
+
+async def enqueue_email(to_email: str, subject: str, content: str, dedupe_key: Optional[str] = None):
+    email_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        await db.email_outbox.insert_one({
+            'id': email_id,
+            'dedupe_key': dedupe_key or email_id,
+            'to': to_email,
+            'subject': subject,
+            'content': content,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now
+        })
+    except DuplicateKeyError:
+        return  # Already queued for this event
+    email_wakeup.set()
+
+async def claim_email_batch() -> List[dict]:
+    now = datetime.now(timezone.utc).isoformat()
+    due = {'$or': [
+        {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+        # A worker that died mid-send leaves its lease behind
+        {'status': 'sending', 'locked_until': {'$lte': now}}
+    ]}
+    ids = [doc['id'] async for doc in db.email_outbox.find(due, {'_id': 0, 'id': 1}).limit(EMAIL_BATCH_SIZE)]
+    if not ids:
+        return []
+    claim = str(uuid.uuid4())
+    locked_until = (datetime.now(timezone.utc) + timedelta(seconds=EMAIL_LEASE_SECONDS)).isoformat()
+    await db.email_outbox.update_many(
+        {'id': {'$in': ids}, **due},
+        {'$set': {'status': 'sending', 'claim': claim, 'locked_until': locked_until}}
+    )
+    return await db.email_outbox.find({'claim': claim}, {'_id': 0}).to_list(EMAIL_BATCH_SIZE)
+
+async def drain_email_outbox() -> int:
+    batch = await claim_email_batch()
+    if not batch:
+        return 0
+    try:
+        errors = await asyncio.to_thread(email_transport.send_batch, batch)
+    except Exception as e:
+        # A transport that raises fails the whole batch; each message then takes the
+        # normal retry/backoff path instead of sitting in 'sending' until its lease expires
+        errors = {message['id']: f"{type(e).__name__}: {e}" for message in batch}
+    
+    now = datetime.now(timezone.utc)
+    updates = []
+    for message in batch:
+        error = errors.get(message['id'])
+        if error is None:
+            # sent_at is a native date so the TTL index can expire delivered mail
+            update = {'$set': {'status': 'sent', 'sent_at': now}}
+        else:
+            attempts = message.get('attempts', 0) + 1
+            retry_at = now + timedelta(seconds=EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            update = {'$set': {
+                'status': 'failed' if attempts >= EMAIL_MAX_ATTEMPTS else 'pending',
+                'attempts': attempts,
+                'last_error': error,
+                'next_attempt_at': retry_at.isoformat()
+            }}
+            logger.warning(f"Email to {message['to']} failed (attempt {attempts}): {error}")
+        update['$unset'] = {'claim': '', 'locked_until': ''}
+        updates.append(UpdateOne({'id': message['id'], 'claim': message['claim']}, update))
+    await db.email_outbox.bulk_write(updates, ordered=False)
+    return len(batch)
+
+async def run_email_worker():
+    while True:
+        email_wakeup.clear()
+        try:
+            drained = await drain_email_outbox()
+        except Exception as e:
+            logger.error(f"Email outbox error: {e}")
+            drained = 0
+        if not drained:
+            try:
+                await asyncio.wait_for(email_wakeup.wait(), EMAIL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+def normalize_location(value: str) -> str:
+    return ' '.join(value.split()).lower()
+
+def geo_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    # GeoJSON order is [longitude, latitude]
+    if latitude is None and longitude is None:
+        return None
+    if latitude is None or longitude is None:
+        raise HTTPException(status_code=400, detail="latitude and longitude must be given together")
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+# Keyset pagination: the cursor is the (sort value, id) of the last row returned
+def encode_cursor(doc: dict, field: str) -> str:
+    raw = json.dumps([doc.get(field), doc['id']], default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Both parts go straight into a Mongo filter: scalars only, never operator documents
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(last_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, last_id
+
+def keyset_filter(field: str, direction: int, value, last_id: str) -> dict:
+    op = '$lt' if direction == DESCENDING else '$gt'
+    return {'$or': [{field: {op: value}}, {field: value, 'id': {'$gt': last_id}}]}
+
+async def paginate(collection, query: dict, projection: dict, response: Response, cursor: Optional[str], limit: int,
+                   field: str = 'created_at', direction: int = DESCENDING) -> List[dict]:
+    # Returns one page sorted by (field, id); the next page's cursor goes in X-Next-Cursor
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        query = {**query, **keyset_filter(field, direction, value, last_id)}
+    docs = await collection.find(query, projection).sort([(field, direction), ('id', ASCENDING)]).limit(limit).to_list(limit)
+    if len(docs) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(docs[-1], field)
+    return docs
+
+def admin_listing_query(role: Optional[str] = None, is_verified: Optional[bool] = None, status: Optional[str] = None,
+                        created_from: Optional[str] = None, created_to: Optional[str] = None) -> dict:
+    query = {}
+    if role:
+        query['role'] = role
+    if is_verified is not None:
+        query['is_verified'] = is_verified
+    if status:
+        query['status'] = status
+    for op, bound in (('$gte', created_from), ('$lt', created_to)):
+        if bound:
+            query.setdefault('created_at', {})[op] = utc_timestamp_bound(bound)
+    return query
+
+def utc_timestamp_bound(value: str) -> str:
+    # created_at is stored as an ISO-8601 UTC string (+00:00), so a bound only compares
+    # correctly as a string once it is in the same form. Dates mean midnight in
+    # MESS_TIMEZONE, as do timestamps without an offset.
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            moment = datetime(day.year, day.month, day.day)
+        else:
+            moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if not moment.tzinfo:
+        moment = moment.replace(tzinfo=MESS_TIMEZONE)
+    # Always with microseconds, like the stored timestamps
+    return moment.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+# Fields embedded in list responses instead of the full mess document (no menu)
+MESS_SUMMARY_PROJECTION = {
+    '_id': 0, 'id': 1, 'name': 1, 'address': 1, 'city': 1, 'state': 1, 'mess_type': 1,
+    'contact_number': 1, 'pricing_monthly': 1, 'pricing_weekly': 1, 'rating': 1,
+    'total_ratings': 1, 'is_verified': 1
+}
+
+# Mess fields for list views: everything but the weekly menu and internal keys
+MESS_LIST_PROJECTION = {**MESS_SUMMARY_PROJECTION, 'description': 1, 'owner_id': 1, 'latitude': 1, 'longitude': 1, 'created_at': 1}
+
+# Fields clients may pick with fields= on list endpoints; anything else (password,
+# search keys, counters) is never returned
+LISTING_FIELDS = {
+    'users': {'id', 'name', 'email', 'role', 'phone', 'is_verified', 'created_at'},
+    'messes': {'id', 'name', 'owner_id', 'address', 'city', 'state', 'mess_type', 'description',
+               'contact_number', 'pricing_monthly', 'pricing_weekly', 'menu', 'rating', 'total_ratings',
+               'latitude', 'longitude', 'is_verified', 'created_at'},
+    'complaints': {'id', 'mess_id', 'student_id', 'student_name', 'subject', 'description', 'status',
+                   'created_at', 'resolved_at'},
+}
+
+def listing_projection(collection_name: str, fields: Optional[str], default: dict, sort_field: str = 'created_at') -> dict:
+    # fields=name,city is pushed down to Mongo; id and the sort field are always kept for the cursor
+    if not fields:
+        # An exclusion projection already returns the sort field
+        return {**default, sort_field: 1} if any(default.values()) else default
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = requested - LISTING_FIELDS[collection_name]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    if 'menu' in requested:
+        # Menus live in their own collection; the pointer is enough to attach them
+        requested.add('menu_version')
+    return {'_id': 0, 'id': 1, sort_field: 1, **{name: 1 for name in requested}}
+
+def fast_json(content, response: Optional[Response] = None) -> ORJSONResponse:
+    # Returning a Response directly skips FastAPI's jsonable_encoder/response_model pass,
+    # which only re-checks documents we wrote ourselves. Copies headers set on `response`.
+    return ORJSONResponse(content, headers=dict(response.headers) if response else None)
+
+async def attach_mess_summaries(docs: List[dict]) -> List[dict]:
+    # One $in query for the distinct mess ids instead of a find_one per document
+    mess_ids = list({doc['mess_id'] for doc in docs if doc.get('mess_id')})
+    messes = await db.messes.find({'id': {'$in': mess_ids}}, MESS_SUMMARY_PROJECTION).to_list(len(mess_ids)) if mess_ids else []
+    messes_by_id = {mess['id']: mess for mess in messes}
+    for doc in docs:
+        doc['mess_details'] = messes_by_id.get(doc.get('mess_id'))
+    return docs
+
+# Database Indexes
+# Every collection lookup in the routes below filters on one of these keys.
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        # Admin listing: newest first, optionally filtered by role
+        IndexModel([('created_at', DESCENDING), ('id', ASCENDING)], name='created_at'),
+        IndexModel([('role', ASCENDING), ('created_at', DESCENDING), ('id', ASCENDING)], name='role_created_at'),
+    ],
+    'messes': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('owner_id', ASCENDING)], name='owner_id'),
+        # Search: equality on the normalized location keys, keyset sort on rating/price
+        IndexModel([('is_verified', ASCENDING), ('city_key', ASCENDING), ('rating', DESCENDING), ('id', ASCENDING)], name='verified_city_rating'),
+        IndexModel([('is_verified', ASCENDING), ('city_key', ASCENDING), ('pricing_monthly', ASCENDING), ('id', ASCENDING)], name='verified_city_price'),
+        IndexModel([('is_verified', ASCENDING), ('state_key', ASCENDING), ('rating', DESCENDING), ('id', ASCENDING)], name='verified_state_rating'),
+        IndexModel([('is_verified', ASCENDING), ('state_key', ASCENDING), ('pricing_monthly', ASCENDING), ('id', ASCENDING)], name='verified_state_price'),
+        IndexModel([('is_verified', ASCENDING), ('rating', DESCENDING), ('id', ASCENDING)], name='verified_rating'),
+        IndexModel([('is_verified', ASCENDING), ('pricing_monthly', ASCENDING), ('id', ASCENDING)], name='verified_price'),
+        # Near search: $geoNear over verified messes, filtered on rating/price inside the index
+        IndexModel([('location', GEOSPHERE), ('is_verified', ASCENDING), ('rating', DESCENDING), ('pricing_monthly', ASCENDING)], name='location_2dsphere'),
+        # Typeahead: anchored prefix range on city_key
+        IndexModel([('is_verified', ASCENDING), ('city_key', ASCENDING), ('id', ASCENDING)], name='verified_city_prefix'),
+        # Admin listing
+        IndexModel([('created_at', DESCENDING), ('id', ASCENDING)], name='created_at'),
+        IndexModel([('is_verified', ASCENDING), ('created_at', DESCENDING), ('id', ASCENDING)], name='verified_created_at'),
+    ],
+    'subscriptions': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('student_id', ASCENDING)], name='student_id'),
+        IndexModel([('mess_id', ASCENDING), ('status', ASCENDING)], name='mess_id_status'),
+        # Expiry sweeps and "active on a date" range scans
+        IndexModel([('status', ASCENDING), ('end_date', ASCENDING)], name='status_end_date'),
+        # Idempotency keys for verify-payment retries
+        IndexModel([('payment_id', ASCENDING)], unique=True, partialFilterExpression={'payment_id': {'$type': 'string'}}, name='payment_id_unique'),
+        IndexModel([('order_id', ASCENDING)], unique=True, partialFilterExpression={'order_id': {'$type': 'string'}}, name='order_id_unique'),
+    ],
+    'meal_skips': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('subscription_id', ASCENDING)], name='subscription_id'),
+        IndexModel([('skip_date', ASCENDING)], name='skip_date'),
+        # Skips written before skip_day existed are left out of the uniqueness check
+        IndexModel(
+            [('subscription_id', ASCENDING), ('skip_day', ASCENDING), ('meal_type', ASCENDING)],
+            unique=True, partialFilterExpression={'skip_day': {'$type': 'string'}}, name='subscription_day_meal_unique'
+        ),
+    ],
+    'rate_limits': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, name='expires_at_ttl'),
+    ],
+    'mess_rollups': [
+        IndexModel([('mess_id', ASCENDING), ('period', ASCENDING), ('bucket', ASCENDING)], unique=True, name='mess_period_bucket_unique'),
+        # Worst messes in a bucket, by complaints or by average rating
+        IndexModel([('period', ASCENDING), ('bucket', ASCENDING), ('complaints_opened', DESCENDING)], name='period_bucket_complaints'),
+        IndexModel([('period', ASCENDING), ('bucket', ASCENDING), ('rating_avg', ASCENDING)], name='period_bucket_rating'),
+    ],
+    'menus': [
+        # One immutable document per menu version; the unique key also serializes concurrent updates
+        IndexModel([('mess_id', ASCENDING), ('version', DESCENDING)], unique=True, name='mess_version_unique'),
+    ],
+    'ratings': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('mess_id', ASCENDING)], name='mess_id'),
+        IndexModel([('student_id', ASCENDING)], name='student_id'),
+    ],
+    'complaints': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('mess_id', ASCENDING)], name='mess_id'),
+        IndexModel([('student_id', ASCENDING)], name='student_id'),
+        # Admin listing
+        IndexModel([('created_at', DESCENDING), ('id', ASCENDING)], name='created_at'),
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING), ('id', ASCENDING)], name='status_created_at'),
+    ],
+    'email_outbox': [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('dedupe_key', ASCENDING)], unique=True, name='dedupe_key_unique'),
+        IndexModel([('status', ASCENDING), ('next_attempt_at', ASCENDING)], name='status_next_attempt_at'),
+        IndexModel([('claim', ASCENDING)], sparse=True, name='claim'),
+        IndexModel([('sent_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600, name='sent_at_ttl'),
+    ],
+    'response_cache': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, name='expires_at_ttl'),
+    ],
+    'meal_headcounts': [
+        IndexModel([('mess_id', ASCENDING), ('date', ASCENDING)], unique=True, name='mess_id_date_unique'),
+        IndexModel([('date', ASCENDING)], name='date'),
+    ],
+    'owner_stats': [
+        IndexModel([('owner_id', ASCENDING)], unique=True, name='owner_id_unique'),
+    ],
+}
+
+# Query shapes used by the routes, checked by audit_query_plans()
+AUDIT_QUERIES = [
+    ('users', {'email': 'audit@example.com'}),
+    ('users', {'id': 'audit'}),
+    ('messes', {'id': 'audit'}),
+    ('messes', {'owner_id': 'audit'}),
+    ('messes', {'is_verified': True, 'city_key': 'audit'}),
+    ('messes', {'is_verified': True, 'state_key': 'audit'}),
+    ('messes', {'is_verified': True, 'city_key': {'$regex': '^audit'}}),
+    ('messes', {'location': {'$nearSphere': {'$geometry': {'type': 'Point', 'coordinates': [0, 0]}, '$maxDistance': 1000}},
+                'is_verified': True, 'rating': {'$gte': 0}}),
+    ('subscriptions', {'id': 'audit'}),
+    ('subscriptions', {'student_id': 'audit'}),
+    ('subscriptions', {'mess_id': {'$in': ['audit']}, 'status': 'active'}),
+    ('subscriptions', {'status': 'active', 'end_date': {'$lte': datetime(2000, 1, 1, tzinfo=timezone.utc)}}),
+    ('subscriptions', {'payment_id': {'$eq': 'audit', '$type': 'string'}}),
+    ('subscriptions', {'order_id': {'$eq': 'audit', '$type': 'string'}}),
+    ('menus', {'mess_id': 'audit', 'version': 1}),
+    ('ratings', {'mess_id': 'audit'}),
+    ('ratings', {'student_id': 'audit'}),
+    ('mess_rollups', {'mess_id': 'audit', 'period': 'week', 'bucket': {'$gte': 'audit'}}),
+    ('mess_rollups', {'period': 'week', 'bucket': 'audit', 'ratings_count': {'$gte': 1}}),
+    ('owner_stats', {'owner_id': 'audit'}),
+    ('meal_headcounts', {'mess_id': 'audit', 'date': 'audit'}),
+    ('meal_skips', {'subscription_id': 'audit', 'skip_day': 'audit', 'meal_type': 'lunch'}),
+    ('complaints', {'mess_id': 'audit'}),
+    ('complaints', {'student_id': 'audit'}),
+    ('complaints', {'status': 'pending', 'created_at': {'$gte': 'audit'}}),
+    ('users', {'role': 'owner'}),
+    ('email_outbox', {'status': 'pending', 'next_attempt_at': {'$lte': 'audit'}}),
+    ('email_outbox', {'claim': 'audit'}),
+]
+
+async def ensure_indexes():
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except Exception as e:
+            # A unique index fails to build while duplicates exist; keep serving
+            logger.error(f"Index creation failed for {collection}: {e}")
+
+async def reconcile_rating_counters() -> int:
+    # Rebuild rating_sum/total_ratings/rating on every mess from the ratings collection
+    totals = {}
+    async for row in db.ratings.aggregate([
+        {'$group': {'_id': '$mess_id', 'rating_sum': {'$sum': '$rating'}, 'total_ratings': {'$sum': 1}}}
+    ]):
+        totals[row['_id']] = row
+    
+    updates = []
+    count = 0
+    async for mess in db.messes.find({}, {'_id': 0, 'id': 1}):
+        row = totals.get(mess['id'], {'rating_sum': 0.0, 'total_ratings': 0})
+        updates.append(UpdateOne({'id': mess['id']}, {'$set': {
+            'rating_sum': row['rating_sum'],
+            'total_ratings': row['total_ratings'],
+            'rating': row['rating_sum'] / row['total_ratings'] if row['total_ratings'] else 0.0
+        }}))
+        count += 1
+        if len(updates) == 1000:
+            await db.messes.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.messes.bulk_write(updates, ordered=False)
+    return count
+
+# Owner Dashboard Stats
+# owner_stats holds one materialized document per owner:
+# {owner_id, active_subscriptions, total_revenue, messes: {mess_id: {name, active_subscriptions, revenue, rating}}}
+# Writes only adjust documents that already exist; a missing document is rebuilt on the next dashboard read.
+def _subscription_revenue_pipeline(match: dict) -> List[dict]:
+    # Group by (mess, plan) first so the join with mess pricing runs once per group, not per subscription
+    return [
+        {'$match': {**match, 'status': 'active'}},
+        {'$group': {'_id': {'mess_id': '$mess_id', 'plan_type': '$plan_type'}, 'count': {'$sum': 1}}},
+        {'$lookup': {'from': 'messes', 'localField': '_id.mess_id', 'foreignField': 'id', 'as': 'mess'}},
+        {'$unwind': '$mess'},
+        {'$group': {
+            '_id': '$_id.mess_id',
+            'active_subscriptions': {'$sum': '$count'},
+            'revenue': {'$sum': {'$multiply': ['$count', {'$cond': [
+                {'$eq': ['$_id.plan_type', 'monthly']}, '$mess.pricing_monthly', '$mess.pricing_weekly'
+            ]}]}}
+        }}
+    ]
+
+async def rebuild_owner_stats(owner_id: Optional[str] = None) -> List[dict]:
+    mess_query = {'owner_id': owner_id} if owner_id else {}
+    messes = await db.messes.find(mess_query, {'_id': 0, 'id': 1, 'name': 1, 'owner_id': 1, 'rating': 1}).to_list(None)
+    stats = {}
+    for mess in messes:
+        doc = stats.setdefault(mess['owner_id'], {'owner_id': mess['owner_id'], 'active_subscriptions': 0, 'total_revenue': 0, 'messes': {}})
+        doc['messes'][mess['id']] = {'name': mess['name'], 'active_subscriptions': 0, 'revenue': 0, 'rating': mess.get('rating', 0)}
+    
+    match = {'mess_id': {'$in': [m['id'] for m in messes]}} if owner_id else {}
+    owners_by_mess = {m['id']: m['owner_id'] for m in messes}
+    async for row in db.subscriptions.aggregate(_subscription_revenue_pipeline(match)):
+        doc = stats.get(owners_by_mess.get(row['_id']))
+        if not doc:
+            continue
+        doc['messes'][row['_id']].update(active_subscriptions=row['active_subscriptions'], revenue=row['revenue'])
+        doc['active_subscriptions'] += row['active_subscriptions']
+        doc['total_revenue'] += row['revenue']
+    
+    if owner_id and owner_id not in stats:
+        stats[owner_id] = {'owner_id': owner_id, 'active_subscriptions': 0, 'total_revenue': 0, 'messes': {}}
+    for doc in stats.values():
+        doc['updated_at'] = datetime.now(timezone.utc).isoformat()
+        await db.owner_stats.replace_one({'owner_id': doc['owner_id']}, doc, upsert=True)
+    return list(stats.values())
+
+async def apply_subscription_stats(subscription: dict, sign: int):
+    # sign is +1 when a subscription becomes active and -1 when it stops being active
+    mess = await db.messes.find_one({'id': subscription['mess_id']}, {'_id': 0, 'owner_id': 1, 'pricing_monthly': 1, 'pricing_weekly': 1})
+    if not mess:
         return
+    price = mess['pricing_monthly'] if subscription['plan_type'] == 'monthly' else mess['pricing_weekly']
+    mess_key = f"messes.{subscription['mess_id']}"
+    await db.owner_stats.update_one({'owner_id': mess['owner_id']}, {'$inc': {
+        'active_subscriptions': sign,
+        'total_revenue': sign * price,
+        f'{mess_key}.active_subscriptions': sign,
+        f'{mess_key}.revenue': sign * price
+    }})
+
+async def owner_dashboard(owner_id: str) -> dict:
+    stats = await db.owner_stats.find_one({'owner_id': owner_id}, {'_id': 0})
+    if not stats:
+        stats = (await rebuild_owner_stats(owner_id))[0]
+    
+    messes = [{'mess_id': mess_id, **entry} for mess_id, entry in stats['messes'].items()]
+    avg_rating = sum(m.get('rating', 0) for m in messes) / len(messes) if messes else 0
+    
+    return {
+        'total_messes': len(messes),
+        'active_subscriptions': stats['active_subscriptions'],
+        'total_revenue': stats['total_revenue'],
+        'average_rating': avg_rating,
+        'messes': messes
+    }
+
+# Meal Headcounts
+# meal_headcounts holds one counter document per mess per day:
+# {mess_id, date: 'YYYY-MM-DD', subscribers, skips: {breakfast, lunch, dinner}}
+# Meals to cook = subscribers - skips[meal]. Subscription and skip writes adjust it with $inc.
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+MEAL_SERVING_HOURS = {'breakfast': 8, 'lunch': 13, 'dinner': 20}
+MESS_TIMEZONE = ZoneInfo(os.environ.get('MESS_TIMEZONE', 'Asia/Kolkata'))
+HEADCOUNT_WINDOW_DAYS = 35
+MAX_BULK_SKIP_DAYS = 31
+
+def local_date(value) -> date:
+    # Calendar day in the mess's timezone; naive timestamps are taken as already local
+    moment = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if moment.tzinfo:
+        moment = moment.astimezone(MESS_TIMEZONE)
+    return moment.date()
+
+def local_today() -> date:
+    return datetime.now(MESS_TIMEZONE).date()
+
+def meal_date(value: str) -> str:
+    return local_date(value).isoformat()
+
+def subscription_dates(subscription: dict, since: Optional[date] = None) -> List[str]:
+    # Days the subscription is served: start date up to, not including, the end date
+    start = local_date(subscription['start_date'])
+    end = local_date(subscription['end_date'])
+    if since and since > start:
+        start = since
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days)]
+
+async def adjust_headcount_subscribers(subscription: dict, sign: int, since: Optional[date] = None):
+    updates = [
+        UpdateOne({'mess_id': subscription['mess_id'], 'date': day}, {'$inc': {'subscribers': sign}}, upsert=True)
+        for day in subscription_dates(subscription, since)
+    ]
+    if updates:
+        await db.meal_headcounts.bulk_write(updates, ordered=False)
+
+async def adjust_headcount_skips(mess_id: str, skips: List[dict], sign: int):
+    updates = [
+        UpdateOne({'mess_id': mess_id, 'date': meal_date(skip['skip_date'])}, {'$inc': {f"skips.{skip['meal_type']}": sign}}, upsert=True)
+        for skip in skips
+    ]
+    if updates:
+        await db.meal_headcounts.bulk_write(updates, ordered=False)
+
+async def release_subscription_headcount(subscription: dict):
+    # The subscription stops being served from today: drop it and its own pending skips
+    today = local_today()
+    await adjust_headcount_subscribers(subscription, -1, since=today)
+    remaining = set(subscription_dates(subscription, since=today))
+    skips = await db.meal_skips.find({'subscription_id': subscription['id']}, {'_id': 0, 'skip_date': 1, 'meal_type': 1}).to_list(None)
+    await adjust_headcount_skips(subscription['mess_id'], [skip for skip in skips if meal_date(skip['skip_date']) in remaining], -1)
+
+async def rebuild_meal_headcounts(days: int = HEADCOUNT_WINDOW_DAYS) -> int:
+    # Recompute every counter from yesterday through the window from subscriptions and meal_skips
+    window_start = local_today() - timedelta(days=1)
+    window = {(window_start + timedelta(days=offset)).isoformat() for offset in range(days + 1)}
+    counters = {}
+    served = {}
+    window_start_at = datetime(window_start.year, window_start.month, window_start.day, tzinfo=MESS_TIMEZONE)
+    active = {'status': 'active', 'end_date': {'$gt': window_start_at}}
+    async for sub in db.subscriptions.find(active, {'_id': 0, 'id': 1, 'mess_id': 1, 'start_date': 1, 'end_date': 1}):
+        dates = window.intersection(subscription_dates(sub, since=window_start))
+        served[sub['id']] = dates
+        for day in dates:
+            counter = counters.setdefault((sub['mess_id'], day), {'subscribers': 0, 'skips': dict.fromkeys(MEAL_TYPES, 0)})
+            counter['subscribers'] += 1
+    async for skip in db.meal_skips.find({'skip_date': {'$gte': window_start.isoformat()}}, {'_id': 0, 'subscription_id': 1, 'mess_id': 1, 'skip_date': 1, 'meal_type': 1}):
+        day = meal_date(skip['skip_date'])
+        counter = counters.get((skip.get('mess_id'), day))
+        if counter and day in served.get(skip['subscription_id'], ()) and skip['meal_type'] in MEAL_TYPES:
+            counter['skips'][skip['meal_type']] += 1
+    
+    rebuilt_at = datetime.now(timezone.utc).isoformat()
+    updates = [
+        UpdateOne({'mess_id': mess_id, 'date': day}, {'$set': {**counter, 'rebuilt_at': rebuilt_at}}, upsert=True)
+        for (mess_id, day), counter in counters.items()
+    ]
+    for start in range(0, len(updates), 1000):
+        await db.meal_headcounts.bulk_write(updates[start:start + 1000], ordered=False)
+    # Counters in the window that no longer have any source rows
+    await db.meal_headcounts.delete_many({'date': {'$in': sorted(window)}, 'rebuilt_at': {'$ne': rebuilt_at}})
+    return len(updates)
+
+async def record_meal_skips(subscription: dict, skips: List[dict]) -> List[bool]:
+    # Upserts on (subscription_id, skip_day, meal_type); returns whether each skip was new
+    operations = [
+        UpdateOne(
+            {'subscription_id': skip['subscription_id'], 'skip_day': skip['skip_day'], 'meal_type': skip['meal_type']},
+            {'$setOnInsert': skip},
+            upsert=True
+        )
+        for skip in skips
+    ]
+    try:
+        result = await db.meal_skips.bulk_write(operations, ordered=False)
+        inserted = set(result.upserted_ids)
+    except BulkWriteError as e:
+        # Concurrent upserts of the same key surface as duplicate key errors; those are duplicates too
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        inserted = {upsert['index'] for upsert in e.details['upserted']}
+    
+    # Only meals the subscription would actually be served reduce the headcount
+    served = set(subscription_dates(subscription)) if subscription['status'] == 'active' else set()
+    counted = [skip for index, skip in enumerate(skips) if index in inserted and skip['skip_day'] in served]
+    await adjust_headcount_skips(subscription['mess_id'], counted, 1)
+    return [index in inserted for index in range(len(skips))]
+
+# Analytics Rollups
+# mess_rollups holds one counter document per mess per day and per week (weeks start on
+# Monday, both in MESS_TIMEZONE):
+# {mess_id, period: 'day'|'week', bucket: 'YYYY-MM-DD', complaints_opened, complaints_resolved,
+#  resolve_seconds, ratings_count, rating_sum, rating_avg, stars_1..stars_5}
+# Complaint and rating writes adjust both buckets; admin analytics only read these.
+ROLLUP_PERIODS = ('day', 'week')
+
+def rollup_buckets(moment) -> dict:
+    day = local_date(moment)
+    return {'day': day.isoformat(), 'week': (day - timedelta(days=day.weekday())).isoformat()}
+
+STAR_FIELDS = ('stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+
+def rating_star(value: float) -> str:
+    # Distribution field for a rating, e.g. 4.4 -> stars_4
+    return STAR_FIELDS[min(5, max(1, round(value))) - 1]
+
+def rating_rollup_update(value: float) -> list:
+    star = rating_star(value)
+    return [
+        {'$set': {
+            'ratings_count': {'$add': [{'$ifNull': ['$ratings_count', 0]}, 1]},
+            'rating_sum': {'$add': [{'$ifNull': ['$rating_sum', 0]}, value]},
+            star: {'$add': [{'$ifNull': [f'${star}', 0]}, 1]}
+        }},
+        {'$set': {'rating_avg': {'$divide': ['$rating_sum', '$ratings_count']}}}
+    ]
+
+async def update_mess_rollups(mess_id: str, moment, update):
+    async def apply(period: str, bucket: str):
+        key = {'mess_id': mess_id, 'period': period, 'bucket': bucket}
+        try:
+            await db.mess_rollups.update_one(key, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost the race to create the bucket; it exists now
+            await db.mess_rollups.update_one(key, update)
+    await asyncio.gather(*(apply(period, bucket) for period, bucket in rollup_buckets(moment).items()))
+
+def analytics_bucket(value: Optional[str], period: str) -> str:
+    # Accepts any date in the bucket; defaults to the current one
+    try:
+        day = date.fromisoformat(value) if value else local_today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    return rollup_buckets(datetime(day.year, day.month, day.day))[period]
+
+def rollup_view(doc: dict) -> dict:
+    resolved = doc.get('complaints_resolved', 0)
+    return {
+        'mess_id': doc['mess_id'],
+        'period': doc['period'],
+        'bucket': doc['bucket'],
+        'complaints_opened': doc.get('complaints_opened', 0),
+        'complaints_resolved': resolved,
+        'mean_resolve_hours': doc.get('resolve_seconds', 0) / resolved / 3600 if resolved else None,
+        'ratings_count': doc.get('ratings_count', 0),
+        'rating_avg': doc.get('rating_avg'),
+        'ratings': {field[-1]: doc.get(field, 0) for field in STAR_FIELDS}
+    }
+
+async def rebuild_mess_rollups() -> int:
+    # Recompute every bucket from complaints and ratings
+    counters = {}
+    
+    def buckets_for(mess_id: str, moment):
+        for period, bucket in rollup_buckets(moment).items():
+            yield counters.setdefault((mess_id, period, bucket), {
+                'complaints_opened': 0, 'complaints_resolved': 0, 'resolve_seconds': 0.0,
+                'ratings_count': 0, 'rating_sum': 0.0, **dict.fromkeys(STAR_FIELDS, 0)
+            })
+    
+    async for complaint in db.complaints.find({}, {'_id': 0, 'mess_id': 1, 'created_at': 1, 'resolved_at': 1, 'status': 1}):
+        for counter in buckets_for(complaint['mess_id'], complaint['created_at']):
+            counter['complaints_opened'] += 1
+        if complaint.get('status') == 'resolved' and complaint.get('resolved_at'):
+            taken = datetime.fromisoformat(complaint['resolved_at']) - datetime.fromisoformat(complaint['created_at'])
+            for counter in buckets_for(complaint['mess_id'], complaint['resolved_at']):
+                counter['complaints_resolved'] += 1
+                counter['resolve_seconds'] += taken.total_seconds()
+    async for rating in db.ratings.find({}, {'_id': 0, 'mess_id': 1, 'rating': 1, 'created_at': 1}):
+        star = rating_star(rating['rating'])
+        for counter in buckets_for(rating['mess_id'], rating['created_at']):
+            counter['ratings_count'] += 1
+            counter['rating_sum'] += rating['rating']
+            counter[star] += 1
+    
+    rebuilt_at = datetime.now(timezone.utc).isoformat()
+    updates = []
+    for (mess_id, period, bucket), counter in counters.items():
+        rating_avg = counter['rating_sum'] / counter['ratings_count'] if counter['ratings_count'] else None
+        updates.append(UpdateOne(
+            {'mess_id': mess_id, 'period': period, 'bucket': bucket},
+            {'$set': {**counter, 'rating_avg': rating_avg, 'rebuilt_at': rebuilt_at}},
+            upsert=True
+        ))
+    for start in range(0, len(updates), 1000):
+        await db.mess_rollups.bulk_write(updates[start:start + 1000], ordered=False)
+    await db.mess_rollups.delete_many({'rebuilt_at': {'$ne': rebuilt_at}})
+    return len(updates)
+
+# Subscription Expiry
+SUBSCRIPTION_SWEEP_SECONDS = float(os.environ.get('SUBSCRIPTION_SWEEP_SECONDS', '300'))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+async def acquire_lock(name: str, seconds: float) -> bool:
+    # Held until it expires; a live lock makes the upsert collide on _id instead of matching
+    now = datetime.now(timezone.utc)
     try:
-        message = Mail(
-            from_email=os.environ.get('SENDER_EMAIL', 'noreply@smartmess.com'),
-            to_emails=to_email,
-            subject=subject,
-            html_content=content
+        await db.locks.update_one(
+            {'_id': name, 'locked_until': {'$lte': now}},
+            {'$set': {'locked_until': now + timedelta(seconds=seconds), 'holder': WORKER_ID}},
+            upsert=True
         )
-        sg = SendGridAPIClient(sendgrid_api_key)
-        sg.send(message)
-    except Exception as e:
-        print(f"Email error: {e}")
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def expire_subscriptions() -> int:
+    now = datetime.now(timezone.utc)
+    ended = {'status': 'active', 'end_date': {'$lte': now}}
+    mess_ids = await db.subscriptions.distinct('mess_id', ended)
+    if not mess_ids:
+        return 0
+    result = await db.subscriptions.update_many(ended, {'$set': {'status': 'expired'}})
+    # Served days end with end_date, so headcounts need no change; dashboard totals do
+    owner_ids = await db.messes.distinct('owner_id', {'id': {'$in': mess_ids}})
+    existing = await db.owner_stats.distinct('owner_id', {'owner_id': {'$in': owner_ids}})
+    for owner_id in existing:
+        await rebuild_owner_stats(owner_id)
+    return result.modified_count
+
+async def run_subscription_sweeper():
+    while True:
+        try:
+            if await acquire_lock('subscription-sweeper', SUBSCRIPTION_SWEEP_SECONDS):
+                expired = await expire_subscriptions()
+                if expired:
+                    logger.info(f"Expired {expired} subscriptions")
+        except Exception as e:
+            logger.error(f"Subscription sweep error: {e}")
+        await asyncio.sleep(SUBSCRIPTION_SWEEP_SECONDS)
+
+async def migrate_subscription_dates() -> int:
+    # ISO strings -> BSON dates, converted server-side in one pass
+    result = await db.subscriptions.update_many(
+        {'$or': [{'start_date': {'$type': 'string'}}, {'end_date': {'$type': 'string'}}]},
+        [{'$set': {'start_date': {'$toDate': '$start_date'}, 'end_date': {'$toDate': '$end_date'}}}]
+    )
+    return result.modified_count
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+async def audit_query_plans() -> List[dict]:
+    report = []
+    # A missing collection explains as EOF, which says nothing about its indexes
+    existing = set(await db.list_collection_names())
+    for collection, query in AUDIT_QUERIES:
+        explain = await db[collection].find(query).explain()
+        stages = list(_plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {})))
+        report.append({
+            'collection': collection,
+            'query': query,
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages,
+            'missing': collection not in existing
+        })
+    return report
+
+# Menus
+# Each menu update inserts an immutable version into the menus collection:
+# {id, mess_id, version, menu: [{day, breakfast, lunch, dinner}], created_by, created_at}
+# and moves messes.menu_version to it. Version 0 means no menu yet. Because versions
+# never change, they are cached per worker without invalidation.
+menu_cache = TTLCache(maxsize=int(os.environ.get('MENU_CACHE_SIZE', '5000')), ttl=86400)
+
+async def load_menu(mess_id: str, version: int) -> Optional[dict]:
+    if not version:
+        return None
+    menu = menu_cache.get((mess_id, version))
+    if menu is None:
+        menu = await db.menus.find_one({'mess_id': mess_id, 'version': version}, {'_id': 0})
+        if menu:
+            menu_cache.set((mess_id, version), menu)
+    return menu
+
+async def attach_current_menus(messes: List[dict]) -> List[dict]:
+    # Full mess views embed the current menu. Only documents carrying menu_version are
+    # touched; ones not yet migrated still hold their menu inline.
+    missing = []
+    for mess in messes:
+        if 'menu_version' not in mess:
+            continue
+        menu = menu_cache.get((mess['id'], mess['menu_version'])) if mess['menu_version'] else None
+        if menu is None and mess['menu_version']:
+            missing.append(mess)
+        else:
+            mess['menu'] = menu['menu'] if menu else []
+    if missing:
+        menus = await db.menus.find(
+            {'$or': [{'mess_id': mess['id'], 'version': mess['menu_version']} for mess in missing]},
+            {'_id': 0}
+        ).to_list(len(missing))
+        menus_by_key = {}
+        for menu in menus:
+            menu_cache.set((menu['mess_id'], menu['version']), menu)
+            menus_by_key[(menu['mess_id'], menu['version'])] = menu
+        for mess in missing:
+            mess['menu'] = menus_by_key.get((mess['id'], mess['menu_version']), {}).get('menu', [])
+    return messes
+
+async def current_menu(mess_id: str) -> dict:
+    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0, 'menu_version': 1, 'menu': 1})
+    if not mess:
+        raise HTTPException(status_code=404, detail="Mess not found")
+    menu = await load_menu(mess_id, mess.get('menu_version', 0))
+    return menu or {'mess_id': mess_id, 'version': 0, 'menu': mess.get('menu', [])}
+
+def menu_response(request: Request, content: dict, etag: str, cache_control: str = 'no-cache') -> Response:
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+async def migrate_menus() -> int:
+    # Moves menus embedded in mess documents into version 1; safe to re-run
+    migrated = 0
+    async for mess in db.messes.find({'menu': {'$exists': True}}, {'_id': 0, 'id': 1, 'owner_id': 1, 'menu': 1, 'menu_version': 1}):
+        version = mess.get('menu_version', 0)
+        if mess['menu'] and not version:
+            version = 1
+            try:
+                await db.menus.insert_one({
+                    'id': str(uuid.uuid4()),
+                    'mess_id': mess['id'],
+                    'version': version,
+                    'menu': mess['menu'],
+                    'created_by': mess['owner_id'],
+                    'created_at': datetime.now(timezone.utc).isoformat()
+                })
+            except DuplicateKeyError:
+                pass
+        await db.messes.update_one({'id': mess['id']}, {'$set': {'menu_version': version}, '$unset': {'menu': ''}})
+        migrated += 1
+    await db.messes.update_many({'menu_version': {'$exists': False}}, {'$set': {'menu_version': 0}})
+    return migrated
 
 # Models
 class UserSignup(BaseModel):
@@ -116,16 +1396,24 @@ class MessCreate(BaseModel):
     contact_number: str
     pricing_monthly: float
     pricing_weekly: float
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class Mess(MessCreate):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     owner_id: str
-    menu: List[dict] = []
+    menu: List[dict] = []  # current version, stored in the menus collection
+    menu_version: int = 0
     rating: float = 0.0
+    rating_sum: float = 0.0
     total_ratings: int = 0
     is_verified: bool = False
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class LocationUpdate(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
 class MenuUpdate(BaseModel):
     menu: List[dict]  # [{"day": "Monday", "breakfast": "...", "lunch": "...", "dinner": "..."}]
 
@@ -139,10 +1427,11 @@ class Subscription(BaseModel):
     student_id: str
     mess_id: str
     plan_type: str
-    start_date: str
-    end_date: str
-    status: str = "active"  # active, paused, cancelled
+    start_date: datetime
+    end_date: datetime
+    status: str = "active"  # active, paused, cancelled, expired
     payment_id: Optional[str] = None
+    order_id: Optional[str] = None
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class MealSkip(BaseModel):
@@ -150,6 +1439,12 @@ class MealSkip(BaseModel):
     skip_date: str
     meal_type: str  # breakfast, lunch, dinner
 
+class BulkMealSkip(BaseModel):
+    subscription_id: str
+    start_date: str  # YYYY-MM-DD
+    end_date: str  # YYYY-MM-DD, inclusive
+    meal_types: List[str]
+
 class RatingCreate(BaseModel):
     mess_id: str
     rating: float
@@ -180,7 +1475,9 @@ class PaymentOrder(BaseModel):
 
 # Auth Routes
 @api_router.post("/auth/signup")
-async def signup(user_data: UserSignup):
+async def signup(user_data: UserSignup, request: Request):
+    await enforce_rate_limits(('signup_ip', client_ip(request)))
+    
     existing = await db.users.find_one({'email': user_data.email}, {'_id': 0})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -194,7 +1491,7 @@ async def signup(user_data: UserSignup):
     )
     
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
+    user_dict['password'] = await hash_password(user_data.password)
     
     await db.users.insert_one(user_dict)
     
@@ -202,11 +1499,17 @@ async def signup(user_data: UserSignup):
     return {'token': token, 'user': user}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request, background_tasks: BackgroundTasks):
+    await enforce_rate_limits(('login_ip', client_ip(request)), ('login_email', credentials.email.lower()))
+    
     user = await db.users.find_one({'email': credentials.email}, {'_id': 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await verify_password(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Transparently upgrade hashes made with a different cost factor
+    if password_needs_rehash(user['password']):
+        background_tasks.add_task(rehash_password, user['id'], credentials.password, user['password'])
+    
     token = create_token(user['id'], user['role'])
     user.pop('password', None)
     return {'token': token, 'user': user}
@@ -222,44 +1525,204 @@ async def create_mess(mess_data: MessCreate, current_user: dict = Depends(get_cu
     if current_user['role'] != 'owner':
         raise HTTPException(status_code=403, detail="Only mess owners can create messes")
     
+    location = geo_point(mess_data.latitude, mess_data.longitude)
     mess = Mess(**mess_data.model_dump(), owner_id=current_user['id'])
-    await db.messes.insert_one(mess.model_dump())
-    return mess
+    mess_doc = mess.model_dump(exclude={'menu'})
+    mess_doc['city_key'] = normalize_location(mess.city)
+    mess_doc['state_key'] = normalize_location(mess.state)
+    if location:
+        mess_doc['location'] = location
+    await db.messes.insert_one(mess_doc)
+    await db.owner_stats.update_one({'owner_id': mess.owner_id}, {'$set': {
+        f'messes.{mess.id}': {'name': mess.name, 'active_subscriptions': 0, 'revenue': 0, 'rating': mess.rating}
+    }})
+    return fast_json(mess.model_dump())
+
+MAX_NEAR_RADIUS_KM = 50
+
+async def search_near(point: dict, max_distance: float, query: dict, projection: dict, response: Response,
+                      cursor: Optional[str], limit: int) -> List[dict]:
+    # $geoNear walks the 2dsphere index outward from the point, so results arrive nearest
+    # first and the filters in `query` are applied inside the index scan. Pages are keyed
+    # on (distance_m, id) like paginate(); minDistance skips the pages already served.
+    geo_near = {
+        'near': point, 'distanceField': 'distance_m', 'maxDistance': max_distance,
+        'query': query, 'spherical': True, 'key': 'location'
+    }
+    pipeline = [{'$geoNear': geo_near}]
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        if not isinstance(value, (int, float)) or value < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        geo_near['minDistance'] = value
+        pipeline.append({'$match': keyset_filter('distance_m', ASCENDING, value, last_id)})
+    if any(projection.values()):
+        projection = {**projection, 'distance_m': 1}
+    pipeline += [{'$sort': {'distance_m': 1, 'id': 1}}, {'$limit': limit}, {'$project': projection}]
+    docs = await db.messes.aggregate(pipeline).to_list(limit)
+    if len(docs) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(docs[-1], 'distance_m')
+    return docs
+
+SEARCH_SORTS = {
+    'rating': ('rating', DESCENDING),
+    'price': ('pricing_monthly', ASCENDING),
+}
 
 @api_router.get("/mess/search")
-async def search_messes(city: Optional[str] = None, state: Optional[str] = None):
+async def search_messes(
+    response: Response,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    sort: str = 'rating',
+    prefix: bool = False,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=MAX_NEAR_RADIUS_KM),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    max_price: Optional[float] = Query(None, ge=0),
+    view: str = Query('summary', pattern='^(summary|full)$'),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100)
+):
+    if sort not in SEARCH_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SEARCH_SORTS)}")
+    
     query = {'is_verified': True}
-    if city:
-        query['city'] = {'$regex': city, '$options': 'i'}
+    if min_rating is not None:
+        query['rating'] = {'$gte': min_rating}
+    if max_price is not None:
+        query['pricing_monthly'] = {'$lte': max_price}
+    near = geo_point(lat, lng)
+    if near:
+        if prefix:
+            raise HTTPException(status_code=400, detail="Prefix search cannot be combined with lat/lng")
+        if city:
+            query['city_key'] = normalize_location(city)
+        if state:
+            query['state_key'] = normalize_location(state)
+        projection = listing_projection('messes', fields, MESS_LIST_PROJECTION if view == 'summary' else {'_id': 0}, 'distance_m')
+        messes = await search_near(near, radius_km * 1000, query, projection, response, cursor, limit)
+        return fast_json(await attach_current_menus(messes), response)
+    
+    if prefix:
+        # Typeahead: anchored prefix on the lowercased key stays an index range scan
+        if not city:
+            raise HTTPException(status_code=400, detail="Prefix search requires a city")
+        query['city_key'] = {'$regex': '^' + re.escape(normalize_location(city))}
+        field, direction = 'city_key', ASCENDING
+    else:
+        if city:
+            query['city_key'] = normalize_location(city)
+        field, direction = SEARCH_SORTS[sort]
     if state:
-        query['state'] = {'$regex': state, '$options': 'i'}
+        query['state_key'] = normalize_location(state)
     
-    messes = await db.messes.find(query, {'_id': 0}).to_list(100)
-    return messes
+    projection = listing_projection('messes', fields, MESS_LIST_PROJECTION if view == 'summary' else {'_id': 0}, field)
+    messes = await paginate(db.messes, query, projection, response, cursor, limit, field, direction)
+    return fast_json(await attach_current_menus(messes), response)
 
 @api_router.get("/mess/{mess_id}")
-async def get_mess(mess_id: str):
-    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0})
-    if not mess:
-        raise HTTPException(status_code=404, detail="Mess not found")
-    return mess
+async def get_mess(mess_id: str, request: Request):
+    async def load_mess():
+        mess = await db.messes.find_one({'id': mess_id}, {'_id': 0})
+        if not mess:
+            raise HTTPException(status_code=404, detail="Mess not found")
+        return (await attach_current_menus([mess]))[0]
+    
+    return await cached_json_response(request, f"mess:{mess_id}", load_mess)
 
 @api_router.get("/mess/owner/my-messes")
-async def get_owner_messes(current_user: dict = Depends(get_current_user)):
+async def get_owner_messes(
+    view: str = Query('full', pattern='^(summary|full)$'),
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     if current_user['role'] != 'owner':
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messes = await db.messes.find({'owner_id': current_user['id']}, {'_id': 0}).to_list(100)
-    return messes
+    projection = listing_projection('messes', fields, MESS_LIST_PROJECTION if view == 'summary' else {'_id': 0})
+    messes = await db.messes.find({'owner_id': current_user['id']}, projection).to_list(100)
+    return fast_json(await attach_current_menus(messes))
 
 @api_router.put("/mess/{mess_id}/menu")
 async def update_menu(mess_id: str, menu_data: MenuUpdate, current_user: dict = Depends(get_current_user)):
-    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0})
+    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0, 'owner_id': 1})
     if not mess or mess['owner_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.messes.update_one({'id': mess_id}, {'$set': {'menu': menu_data.menu}})
-    return {'message': 'Menu updated successfully'}
+    # Number from the menus collection, not the pointer: if a previous update inserted its
+    # version but never moved the pointer, this one still gets a free version and heals it
+    latest = await db.menus.find_one({'mess_id': mess_id}, {'_id': 0, 'version': 1}, sort=[('version', DESCENDING)])
+    version = (latest['version'] if latest else 0) + 1
+    try:
+        await db.menus.insert_one({
+            'id': str(uuid.uuid4()),
+            'mess_id': mess_id,
+            'version': version,
+            'menu': menu_data.menu,
+            'created_by': current_user['id'],
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Menu was updated at the same time, please retry")
+    
+    # $max keeps the pointer monotonic; $unset drops a menu embedded before migrate-menus
+    await db.messes.update_one({'id': mess_id}, {'$max': {'menu_version': version}, '$unset': {'menu': ''}})
+    await invalidate_mess_responses(mess_id)
+    return {'message': 'Menu updated successfully', 'version': version}
+
+@api_router.put("/mess/{mess_id}/location")
+async def update_location(mess_id: str, location_data: LocationUpdate, current_user: dict = Depends(get_current_user)):
+    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0, 'owner_id': 1})
+    if not mess or mess['owner_id'] != current_user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    await db.messes.update_one({'id': mess_id}, {'$set': {
+        'latitude': location_data.latitude,
+        'longitude': location_data.longitude,
+        'location': geo_point(location_data.latitude, location_data.longitude)
+    }})
+    await invalidate_mess_responses(mess_id)
+    return {'message': 'Location updated successfully'}
+
+@api_router.get("/mess/{mess_id}/menu")
+async def get_mess_menu(mess_id: str, request: Request):
+    menu = await current_menu(mess_id)
+    return menu_response(request, menu, f'"menu:{mess_id}:{menu["version"]}"')
+
+@api_router.get("/mess/{mess_id}/menu/today")
+async def get_today_menu(mess_id: str, request: Request):
+    menu = await current_menu(mess_id)
+    today = local_today()
+    weekday = today.strftime('%A').lower()
+    meals = next((entry for entry in menu['menu'] if str(entry.get('day', '')).lower() == weekday), None)
+    content = {'mess_id': mess_id, 'version': menu['version'], 'date': today.isoformat(), 'day': today.strftime('%A'), 'meals': meals}
+    return menu_response(request, content, f'"menu:{mess_id}:{menu["version"]}:{today.isoformat()}"')
+
+@api_router.get("/mess/{mess_id}/menu/history")
+async def get_menu_history(
+    mess_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0, 'owner_id': 1})
+    if not mess or (mess['owner_id'] != current_user['id'] and current_user['role'] != 'admin'):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    versions = await db.menus.find(
+        {'mess_id': mess_id}, {'_id': 0, 'version': 1, 'created_by': 1, 'created_at': 1}
+    ).sort('version', DESCENDING).limit(limit).to_list(limit)
+    return fast_json(versions)
+
+@api_router.get("/mess/{mess_id}/menu/{version}")
+async def get_menu_version(mess_id: str, version: int, request: Request):
+    menu = await load_menu(mess_id, version)
+    if not menu:
+        raise HTTPException(status_code=404, detail="Menu version not found")
+    # A version never changes, so clients and proxies may keep it indefinitely
+    return menu_response(request, menu, f'"menu:{mess_id}:{version}"', 'public, max-age=31536000, immutable')
 
 # Subscription Routes
 @api_router.post("/subscription/create-order")
@@ -269,50 +1732,65 @@ async def create_subscription_order(payment_data: PaymentOrder, current_user: di
     
     try:
         amount_paise = int(payment_data.amount * 100)
-        order = razorpay_client.order.create({
-            'amount': amount_paise,
-            'currency': 'INR',
-            'payment_capture': 1
-        })
+        order = await payment_gateway.create_order(amount_paise)
         return order
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Payment gateway timed out")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/subscription/verify-payment")
-async def verify_payment(payment_id: str, order_id: str, signature: str, subscription_data: SubscriptionCreate, current_user: dict = Depends(get_current_user), background_tasks: BackgroundTasks = None):
-    try:
-        razorpay_client.utility.verify_payment_signature({
-            'razorpay_order_id': order_id,
-            'razorpay_payment_id': payment_id,
-            'razorpay_signature': signature
-        })
-    except:
+async def verify_payment(payment_id: str, order_id: str, signature: str, subscription_data: SubscriptionCreate, current_user: dict = Depends(get_current_user)):
+    if not payment_gateway.verify_signature(order_id, payment_id, signature):
         raise HTTPException(status_code=400, detail="Payment verification failed")
     
+    # A retried verification returns the subscription the first attempt created.
+    # The $type clause matches the partial unique indexes so the planner can use them.
+    existing = await db.subscriptions.find_one({'payment_id': {'$eq': payment_id, '$type': 'string'}}, {'_id': 0})
+    if existing:
+        if existing['student_id'] != current_user['id']:
+            raise HTTPException(status_code=409, detail="Payment already used")
+        return existing
+    
     # Calculate end date
     start = datetime.fromisoformat(subscription_data.start_date)
+    if not start.tzinfo:
+        start = start.replace(tzinfo=MESS_TIMEZONE)
     days = 30 if subscription_data.plan_type == 'monthly' else 7
-    end_date = (start + timedelta(days=days)).isoformat()
+    end_date = start + timedelta(days=days)
     
     subscription = Subscription(
         student_id=current_user['id'],
         mess_id=subscription_data.mess_id,
         plan_type=subscription_data.plan_type,
-        start_date=subscription_data.start_date,
+        start_date=start,
         end_date=end_date,
-        payment_id=payment_id
+        payment_id=payment_id,
+        order_id=order_id
     )
     
-    await db.subscriptions.insert_one(subscription.model_dump())
+    try:
+        await db.subscriptions.insert_one(subscription.model_dump())
+    except DuplicateKeyError:
+        # Lost a race with a concurrent retry of the same payment/order
+        existing = await db.subscriptions.find_one(
+            {'$or': [{'payment_id': {'$eq': payment_id, '$type': 'string'}},
+                     {'order_id': {'$eq': order_id, '$type': 'string'}}]}, {'_id': 0}
+        )
+        if not existing or existing['student_id'] != current_user['id']:
+            raise HTTPException(status_code=409, detail="Payment already used")
+        return existing
+    await apply_subscription_stats(subscription.model_dump(), 1)
+    await adjust_headcount_subscribers(subscription.model_dump(), 1)
     
     # Send confirmation email
-    mess = await db.messes.find_one({'id': subscription_data.mess_id}, {'_id': 0})
-    if background_tasks:
-        background_tasks.add_task(
-            send_email,
+    mess = await db.messes.find_one({'id': subscription_data.mess_id}, {'_id': 0, 'name': 1})
+    if mess:
+        await enqueue_email(
             current_user['email'],
             'Subscription Confirmed',
-            f"<h2>Your subscription to {mess['name']} has been confirmed!</h2><p>Plan: {subscription_data.plan_type}</p><p>Start Date: {subscription_data.start_date}</p>"
+            f"<h2>Your subscription to {mess['name']} has been confirmed!</h2><p>Plan: {subscription_data.plan_type}</p><p>Start Date: {subscription_data.start_date}</p>",
+            dedupe_key=f"subscription-confirmed:{subscription.id}"
         )
     
     return subscription
@@ -320,13 +1798,7 @@ async def verify_payment(payment_id: str, order_id: str, signature: str, subscri
 @api_router.get("/subscription/my-subscriptions")
 async def get_my_subscriptions(current_user: dict = Depends(get_current_user)):
     subscriptions = await db.subscriptions.find({'student_id': current_user['id']}, {'_id': 0}).to_list(100)
-    
-    # Enrich with mess details
-    for sub in subscriptions:
-        mess = await db.messes.find_one({'id': sub['mess_id']}, {'_id': 0})
-        sub['mess_details'] = mess
-    
-    return subscriptions
+    return await attach_mess_summaries(subscriptions)
 
 @api_router.put("/subscription/{subscription_id}/pause")
 async def pause_subscription(subscription_id: str, current_user: dict = Depends(get_current_user)):
@@ -334,7 +1806,10 @@ async def pause_subscription(subscription_id: str, current_user: dict = Depends(
     if not subscription or subscription['student_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.subscriptions.update_one({'id': subscription_id}, {'$set': {'status': 'paused'}})
+    result = await db.subscriptions.update_one({'id': subscription_id, 'status': 'active'}, {'$set': {'status': 'paused'}})
+    if result.modified_count:
+        await apply_subscription_stats(subscription, -1)
+        await release_subscription_headcount(subscription)
     return {'message': 'Subscription paused'}
 
 @api_router.put("/subscription/{subscription_id}/cancel")
@@ -343,7 +1818,14 @@ async def cancel_subscription(subscription_id: str, current_user: dict = Depends
     if not subscription or subscription['student_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.subscriptions.update_one({'id': subscription_id}, {'$set': {'status': 'cancelled'}})
+    previous = await db.subscriptions.find_one_and_update(
+        {'id': subscription_id, 'status': {'$ne': 'cancelled'}},
+        {'$set': {'status': 'cancelled'}},
+        projection={'_id': 0, 'status': 1}
+    )
+    if previous and previous['status'] == 'active':
+        await apply_subscription_stats(subscription, -1)
+        await release_subscription_headcount(subscription)
     return {'message': 'Subscription cancelled'}
 
 @api_router.post("/subscription/skip-meal")
@@ -351,21 +1833,94 @@ async def skip_meal(skip_data: MealSkip, current_user: dict = Depends(get_curren
     subscription = await db.subscriptions.find_one({'id': skip_data.subscription_id}, {'_id': 0})
     if not subscription or subscription['student_id'] != current_user['id']:
         raise HTTPException(status_code=403, detail="Not authorized")
+    if skip_data.meal_type not in MEAL_TYPES:
+        raise HTTPException(status_code=400, detail=f"meal_type must be one of: {', '.join(MEAL_TYPES)}")
     
     # Check 2 hour notice
     skip_datetime = datetime.fromisoformat(skip_data.skip_date)
+    if not skip_datetime.tzinfo:
+        skip_datetime = skip_datetime.replace(tzinfo=MESS_TIMEZONE)
     now = datetime.now(timezone.utc)
     if skip_datetime - now < timedelta(hours=2):
         raise HTTPException(status_code=400, detail="Meal skip requires at least 2 hours notice")
     
     skip_doc = skip_data.model_dump()
     skip_doc['id'] = str(uuid.uuid4())
+    skip_doc['skip_day'] = meal_date(skip_data.skip_date)
     skip_doc['student_id'] = current_user['id']
+    skip_doc['mess_id'] = subscription['mess_id']
     skip_doc['created_at'] = datetime.now(timezone.utc).isoformat()
     
-    await db.meal_skips.insert_one(skip_doc)
+    await record_meal_skips(subscription, [skip_doc])
     return {'message': 'Meal skipped successfully'}
 
+@api_router.post("/subscription/skip-meals")
+async def skip_meals(skip_data: BulkMealSkip, current_user: dict = Depends(get_current_user)):
+    subscription = await db.subscriptions.find_one({'id': skip_data.subscription_id}, {'_id': 0})
+    if not subscription or subscription['student_id'] != current_user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not skip_data.meal_types or any(meal_type not in MEAL_TYPES for meal_type in skip_data.meal_types):
+        raise HTTPException(status_code=400, detail=f"meal_types must be chosen from: {', '.join(MEAL_TYPES)}")
+    try:
+        first_day = date.fromisoformat(skip_data.start_date)
+        last_day = date.fromisoformat(skip_data.end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    days = (last_day - first_day).days + 1
+    if days < 1 or days > MAX_BULK_SKIP_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MAX_BULK_SKIP_DAYS} days")
+    
+    served = set(subscription_dates(subscription))
+    now = datetime.now(timezone.utc)
+    created_at = now.isoformat()
+    results = []
+    pending = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        for meal_type in (meal for meal in MEAL_TYPES if meal in skip_data.meal_types):
+            result = {'date': day.isoformat(), 'meal_type': meal_type}
+            results.append(result)
+            served_at = datetime(day.year, day.month, day.day, MEAL_SERVING_HOURS[meal_type], tzinfo=MESS_TIMEZONE)
+            if day.isoformat() not in served:
+                result['status'] = 'not_subscribed'
+            elif served_at - now < timedelta(hours=2):
+                result['status'] = 'too_late'
+            else:
+                pending.append((result, {
+                    'id': str(uuid.uuid4()),
+                    'subscription_id': subscription['id'],
+                    'skip_date': served_at.isoformat(),
+                    'skip_day': day.isoformat(),
+                    'meal_type': meal_type,
+                    'student_id': current_user['id'],
+                    'mess_id': subscription['mess_id'],
+                    'created_at': created_at
+                }))
+    
+    if pending:
+        inserted = await record_meal_skips(subscription, [skip for _, skip in pending])
+        for (result, _), is_new in zip(pending, inserted):
+            result['status'] = 'skipped' if is_new else 'already_skipped'
+    return {'skipped': sum(1 for result in results if result['status'] == 'skipped'), 'results': results}
+
+@api_router.get("/mess/{mess_id}/headcount")
+async def get_meal_headcount(mess_id: str, day: Optional[str] = Query(None, alias='date'), meal: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    mess = await db.messes.find_one({'id': mess_id}, {'_id': 0, 'owner_id': 1})
+    if not mess or (mess['owner_id'] != current_user['id'] and current_user['role'] != 'admin'):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if meal and meal not in MEAL_TYPES:
+        raise HTTPException(status_code=400, detail=f"meal must be one of: {', '.join(MEAL_TYPES)}")
+    try:
+        day = meal_date(day) if day else local_today().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {day}")
+    
+    counter = await db.meal_headcounts.find_one({'mess_id': mess_id, 'date': day}, {'_id': 0}) or {}
+    subscribers = counter.get('subscribers', 0)
+    skips = counter.get('skips', {})
+    meals = {meal_type: subscribers - skips.get(meal_type, 0) for meal_type in ([meal] if meal else MEAL_TYPES)}
+    return {'mess_id': mess_id, 'date': day, 'subscribers': subscribers, 'meals': meals}
+
 # Rating Routes
 @api_router.post("/rating", response_model=Rating)
 async def create_rating(rating_data: RatingCreate, current_user: dict = Depends(get_current_user)):
@@ -379,25 +1934,42 @@ async def create_rating(rating_data: RatingCreate, current_user: dict = Depends(
     )
     
     await db.ratings.insert_one(rating.model_dump())
+    await update_mess_rollups(rating.mess_id, rating.created_at, rating_rollup_update(rating.rating))
     
-    # Update mess rating
-    ratings = await db.ratings.find({'mess_id': rating_data.mess_id}, {'_id': 0}).to_list(1000)
-    avg_rating = sum(r['rating'] for r in ratings) / len(ratings)
-    await db.messes.update_one(
+    # Update mess rating: bump the running counters and derive the average in one atomic write.
+    # Messes rated before rating_sum existed seed it from their stored average and count.
+    legacy_sum = {'$multiply': [{'$ifNull': ['$rating', 0]}, {'$ifNull': ['$total_ratings', 0]}]}
+    mess = await db.messes.find_one_and_update(
         {'id': rating_data.mess_id},
-        {'$set': {'rating': avg_rating, 'total_ratings': len(ratings)}}
+        [
+            {'$set': {
+                'rating_sum': {'$add': [{'$ifNull': ['$rating_sum', legacy_sum]}, rating_data.rating]},
+                'total_ratings': {'$add': [{'$ifNull': ['$total_ratings', 0]}, 1]}
+            }},
+            {'$set': {'rating': {'$divide': ['$rating_sum', '$total_ratings']}}}
+        ],
+        projection={'_id': 0, 'owner_id': 1, 'rating': 1},
+        return_document=ReturnDocument.AFTER
     )
+    if mess:
+        await db.owner_stats.update_one(
+            {'owner_id': mess['owner_id']},
+            {'$set': {f'messes.{rating_data.mess_id}.rating': mess['rating']}}
+        )
+    await invalidate_mess_responses(rating_data.mess_id, ratings=True)
     
-    return rating
+    return fast_json(rating.model_dump())
 
 @api_router.get("/rating/mess/{mess_id}")
-async def get_mess_ratings(mess_id: str):
-    ratings = await db.ratings.find({'mess_id': mess_id}, {'_id': 0}).to_list(100)
-    return ratings
+async def get_mess_ratings(mess_id: str, request: Request):
+    async def load_ratings():
+        return await db.ratings.find({'mess_id': mess_id}, {'_id': 0}).to_list(100)
+    
+    return await cached_json_response(request, f"ratings:{mess_id}", load_ratings)
 
 # Complaint Routes
 @api_router.post("/complaint", response_model=Complaint)
-async def create_complaint(complaint_data: ComplaintCreate, current_user: dict = Depends(get_current_user), background_tasks: BackgroundTasks = None):
+async def create_complaint(complaint_data: ComplaintCreate, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'student':
         raise HTTPException(status_code=403, detail="Only students can file complaints")
     
@@ -408,22 +1980,22 @@ async def create_complaint(complaint_data: ComplaintCreate, current_user: dict =
     )
     
     await db.complaints.insert_one(complaint.model_dump())
+    await update_mess_rollups(complaint.mess_id, complaint.created_at, {'$inc': {'complaints_opened': 1}})
     
     # Notify admin
-    if background_tasks:
-        background_tasks.add_task(
-            send_email,
-            os.environ.get('ADMIN_EMAIL', 'admin@smartmess.com'),
-            'New Complaint Filed',
-            f"<h2>New Complaint</h2><p>From: {current_user['name']}</p><p>Subject: {complaint_data.subject}</p>"
-        )
+    await enqueue_email(
+        os.environ.get('ADMIN_EMAIL', 'admin@smartmess.com'),
+        'New Complaint Filed',
+        f"<h2>New Complaint</h2><p>From: {current_user['name']}</p><p>Subject: {complaint_data.subject}</p>",
+        dedupe_key=f"complaint-filed:{complaint.id}"
+    )
     
-    return complaint
+    return fast_json(complaint.model_dump())
 
 @api_router.get("/complaint/my-complaints")
 async def get_my_complaints(current_user: dict = Depends(get_current_user)):
     complaints = await db.complaints.find({'student_id': current_user['id']}, {'_id': 0}).to_list(100)
-    return complaints
+    return await attach_mess_summaries(complaints)
 
 @api_router.get("/complaint/mess/{mess_id}")
 async def get_mess_complaints(mess_id: str, current_user: dict = Depends(get_current_user)):
@@ -436,23 +2008,47 @@ async def get_mess_complaints(mess_id: str, current_user: dict = Depends(get_cur
 
 # Admin Routes
 @api_router.get("/admin/users")
-async def get_all_users(current_user: dict = Depends(get_current_user)):
+async def get_all_users(
+    response: Response,
+    role: Optional[str] = None,
+    is_verified: Optional[bool] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = await db.users.find({}, {'_id': 0, 'password': 0}).to_list(1000)
-    return users
+    query = admin_listing_query(role=role, is_verified=is_verified, created_from=created_from, created_to=created_to)
+    projection = listing_projection('users', fields, {'_id': 0, 'password': 0})
+    users = await paginate(db.users, query, projection, response, cursor, limit)
+    return fast_json(users, response)
 
 @api_router.get("/admin/messes")
-async def get_all_messes(current_user: dict = Depends(get_current_user)):
+async def get_all_messes(
+    response: Response,
+    is_verified: Optional[bool] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    view: str = Query('summary', pattern='^(summary|full)$'),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    messes = await db.messes.find({}, {'_id': 0}).to_list(1000)
-    return messes
+    query = admin_listing_query(is_verified=is_verified, created_from=created_from, created_to=created_to)
+    projection = listing_projection('messes', fields, MESS_LIST_PROJECTION if view == 'summary' else {'_id': 0})
+    messes = await paginate(db.messes, query, projection, response, cursor, limit)
+    return fast_json(await attach_current_menus(messes), response)
 
 @api_router.put("/admin/verify-mess/{mess_id}")
-async def verify_mess(mess_id: str, current_user: dict = Depends(get_current_user), background_tasks: BackgroundTasks = None):
+async def verify_mess(mess_id: str, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
@@ -461,40 +2057,201 @@ async def verify_mess(mess_id: str, current_user: dict = Depends(get_current_use
         raise HTTPException(status_code=404, detail="Mess not found")
     
     await db.messes.update_one({'id': mess_id}, {'$set': {'is_verified': True}})
+    await invalidate_mess_responses(mess_id)
     
     # Notify owner
     owner = await db.users.find_one({'id': mess['owner_id']}, {'_id': 0})
-    if owner and background_tasks:
-        background_tasks.add_task(
-            send_email,
+    if owner:
+        await enqueue_email(
             owner['email'],
             'Mess Verified',
-            f"<h2>Congratulations!</h2><p>Your mess '{mess['name']}' has been verified and is now live.</p>"
+            f"<h2>Congratulations!</h2><p>Your mess '{mess['name']}' has been verified and is now live.</p>",
+            dedupe_key=f"mess-verified:{mess_id}"
         )
     
     return {'message': 'Mess verified'}
 
 @api_router.get("/admin/complaints")
-async def get_all_complaints(current_user: dict = Depends(get_current_user)):
+async def get_all_complaints(
+    response: Response,
+    status: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    complaints = await db.complaints.find({}, {'_id': 0}).to_list(1000)
-    return complaints
+    query = admin_listing_query(status=status, created_from=created_from, created_to=created_to)
+    projection = listing_projection('complaints', fields, {'_id': 0})
+    complaints = await paginate(db.complaints, query, projection, response, cursor, limit)
+    return fast_json(await attach_mess_summaries(complaints), response)
+
+# Columns written by CSV exports; NDJSON exports write the whole document
+EXPORT_COLUMNS = {
+    'users': ['id', 'name', 'email', 'role', 'phone', 'is_verified', 'created_at'],
+    'messes': ['id', 'name', 'owner_id', 'address', 'city', 'state', 'mess_type', 'contact_number',
+               'pricing_monthly', 'pricing_weekly', 'rating', 'total_ratings', 'is_verified', 'created_at'],
+    'complaints': ['id', 'mess_id', 'student_id', 'student_name', 'subject', 'description', 'status',
+                   'created_at', 'resolved_at'],
+}
+
+async def stream_export(collection, query: dict, columns: List[str], fmt: str):
+    # Rows are written as the Motor cursor yields them, so memory does not grow with the result size
+    projection = {'_id': 0, 'password': 0}
+    cursor = collection.find(query, projection).sort([('created_at', DESCENDING), ('id', ASCENDING)]).batch_size(500)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for doc in cursor:
+            writer.writerow([doc.get(column) for column in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+    else:
+        async for doc in cursor:
+            yield json.dumps(doc, default=str) + '\n'
+
+@api_router.get("/admin/export/{collection_name}")
+async def export_collection(
+    collection_name: str,
+    format: str = 'ndjson',
+    role: Optional[str] = None,
+    is_verified: Optional[bool] = None,
+    status: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if collection_name not in EXPORT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    query = admin_listing_query(role=role, is_verified=is_verified, status=status, created_from=created_from, created_to=created_to)
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        stream_export(db[collection_name], query, EXPORT_COLUMNS[collection_name], format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{collection_name}.{format}"'}
+    )
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {'users': user_cache.stats(), 'tokens': token_cache.stats(), 'responses': response_cache.stats(), 'menus': menu_cache.stats()}
 
 @api_router.put("/admin/complaint/{complaint_id}/resolve")
 async def resolve_complaint(complaint_id: str, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    await db.complaints.update_one(
-        {'id': complaint_id},
-        {'$set': {'status': 'resolved', 'resolved_at': datetime.now(timezone.utc).isoformat()}}
+    resolved_at = datetime.now(timezone.utc)
+    # Only the first resolve counts towards the rollups
+    complaint = await db.complaints.find_one_and_update(
+        {'id': complaint_id, 'status': {'$ne': 'resolved'}},
+        {'$set': {'status': 'resolved', 'resolved_at': resolved_at.isoformat()}},
+        projection={'_id': 0, 'mess_id': 1, 'created_at': 1}
     )
+    if complaint:
+        taken = resolved_at - datetime.fromisoformat(complaint['created_at'])
+        await update_mess_rollups(complaint['mess_id'], resolved_at, {'$inc': {
+            'complaints_resolved': 1,
+            'resolve_seconds': taken.total_seconds()
+        }})
+    elif not await db.complaints.find_one({'id': complaint_id}, {'_id': 0, 'id': 1}):
+        raise HTTPException(status_code=404, detail="Complaint not found")
     return {'message': 'Complaint resolved'}
 
+# Admin Analytics
+# Read-only views over mess_rollups; buckets are 'YYYY-MM-DD' (a week is keyed by its Monday)
+@api_router.get("/admin/analytics/mess/{mess_id}")
+async def get_mess_analytics(
+    mess_id: str,
+    period: str = Query('week', pattern='^(day|week)$'),
+    since: Optional[str] = None,
+    limit: int = Query(52, ge=1, le=366),
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    query = {'mess_id': mess_id, 'period': period}
+    if since:
+        query['bucket'] = {'$gte': analytics_bucket(since, period)}
+    rollups = await db.mess_rollups.find(query, {'_id': 0}).sort('bucket', DESCENDING).limit(limit).to_list(limit)
+    return fast_json([rollup_view(doc) for doc in rollups])
+
+@api_router.get("/admin/analytics/worst-messes")
+async def get_worst_messes(
+    period: str = Query('week', pattern='^(day|week)$'),
+    bucket: Optional[str] = None,
+    by: str = Query('complaints', pattern='^(complaints|rating)$'),
+    min_ratings: int = Query(3, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    bucket = analytics_bucket(bucket, period)
+    query = {'period': period, 'bucket': bucket}
+    if by == 'complaints':
+        query['complaints_opened'] = {'$gt': 0}
+        order = [('complaints_opened', DESCENDING)]
+    else:
+        # A single bad review shouldn't top the list
+        query['ratings_count'] = {'$gte': min_ratings}
+        order = [('rating_avg', ASCENDING)]
+    rollups = await db.mess_rollups.find(query, {'_id': 0}).sort(order).limit(limit).to_list(limit)
+    return fast_json(await attach_mess_summaries([rollup_view(doc) for doc in rollups]))
+
+@api_router.get("/admin/analytics/overview")
+async def get_analytics_overview(
+    period: str = Query('week', pattern='^(day|week)$'),
+    since: Optional[str] = None,
+    limit: int = Query(12, ge=1, le=366),
+    current_user: dict = Depends(get_current_user)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Totals across messes per bucket; reads one rollup per mess per bucket, never raw rows
+    default_since = local_today() - timedelta(days=(limit - 1) * (7 if period == 'week' else 1))
+    match = {'period': period, 'bucket': {'$gte': analytics_bucket(since or default_since.isoformat(), period)}}
+    totals = await db.mess_rollups.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': '$bucket',
+            'complaints_opened': {'$sum': {'$ifNull': ['$complaints_opened', 0]}},
+            'complaints_resolved': {'$sum': {'$ifNull': ['$complaints_resolved', 0]}},
+            'resolve_seconds': {'$sum': {'$ifNull': ['$resolve_seconds', 0]}},
+            'ratings_count': {'$sum': {'$ifNull': ['$ratings_count', 0]}},
+            'rating_sum': {'$sum': {'$ifNull': ['$rating_sum', 0]}}
+        }},
+        {'$sort': {'_id': DESCENDING}},
+        {'$limit': limit}
+    ]).to_list(limit)
+    return fast_json([{
+        'bucket': doc['_id'],
+        'complaints_opened': doc['complaints_opened'],
+        'complaints_resolved': doc['complaints_resolved'],
+        'mean_resolve_hours': doc['resolve_seconds'] / doc['complaints_resolved'] / 3600 if doc['complaints_resolved'] else None,
+        'ratings_count': doc['ratings_count'],
+        'rating_avg': doc['rating_sum'] / doc['ratings_count'] if doc['ratings_count'] else None
+    } for doc in totals])
+
 @api_router.post("/admin/send-warning/{owner_id}")
-async def send_warning(owner_id: str, message: str, current_user: dict = Depends(get_current_user), background_tasks: BackgroundTasks = None):
+async def send_warning(owner_id: str, message: str, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin access required")
     
@@ -502,13 +2259,11 @@ async def send_warning(owner_id: str, message: str, current_user: dict = Depends
     if not owner or owner['role'] != 'owner':
         raise HTTPException(status_code=404, detail="Owner not found")
     
-    if background_tasks:
-        background_tasks.add_task(
-            send_email,
-            owner['email'],
-            'Warning from Smart Mess System',
-            f"<h2>Warning</h2><p>{message}</p>"
-        )
+    await enqueue_email(
+        owner['email'],
+        'Warning from Smart Mess System',
+        f"<h2>Warning</h2><p>{message}</p>"
+    )
     
     return {'message': 'Warning sent'}
 
@@ -518,26 +2273,55 @@ async def get_owner_dashboard_stats(current_user: dict = Depends(get_current_use
     if current_user['role'] != 'owner':
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messes = await db.messes.find({'owner_id': current_user['id']}, {'_id': 0}).to_list(100)
-    mess_ids = [m['id'] for m in messes]
+    return await owner_dashboard(current_user['id'])
+
+# Home Screens
+# Everything a dashboard needs on first paint in one request: independent queries run
+# concurrently and related documents are fetched with one $in query each.
+@api_router.get("/student/home")
+async def get_student_home(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'student':
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    subscriptions = await db.subscriptions.find({'mess_id': {'$in': mess_ids}, 'status': 'active'}, {'_id': 0}).to_list(1000)
+    subscriptions, complaints, ratings = await asyncio.gather(
+        db.subscriptions.find({'student_id': current_user['id']}, {'_id': 0}).to_list(100),
+        db.complaints.find({'student_id': current_user['id']}, {'_id': 0}).to_list(100),
+        db.ratings.find({'student_id': current_user['id']}, {'_id': 0}).to_list(100)
+    )
+    # One mess lookup shared by subscriptions and complaints
+    await attach_mess_summaries(subscriptions + complaints)
     
-    total_revenue = 0
-    for sub in subscriptions:
-        mess = next((m for m in messes if m['id'] == sub['mess_id']), None)
-        if mess:
-            price = mess['pricing_monthly'] if sub['plan_type'] == 'monthly' else mess['pricing_weekly']
-            total_revenue += price
+    return fast_json({
+        'user': current_user,
+        'subscriptions': subscriptions,
+        'complaints': complaints,
+        'ratings': ratings
+    })
+
+@api_router.get("/owner/home")
+async def get_owner_home(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'owner':
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    avg_rating = sum(m.get('rating', 0) for m in messes) / len(messes) if messes else 0
+    messes, dashboard = await asyncio.gather(
+        db.messes.find({'owner_id': current_user['id']}, {'_id': 0}).to_list(100),
+        owner_dashboard(current_user['id'])
+    )
+    mess_ids = [mess['id'] for mess in messes]
+    _, complaints = await asyncio.gather(
+        attach_current_menus(messes),
+        db.complaints.find({'mess_id': {'$in': mess_ids}}, {'_id': 0}).to_list(100 * max(len(mess_ids), 1))
+    )
+    complaints_by_mess = {mess_id: [] for mess_id in mess_ids}
+    for complaint in complaints:
+        complaints_by_mess[complaint['mess_id']].append(complaint)
     
-    return {
-        'total_messes': len(messes),
-        'active_subscriptions': len(subscriptions),
-        'total_revenue': total_revenue,
-        'average_rating': avg_rating
-    }
+    return fast_json({
+        'user': current_user,
+        'messes': messes,
+        'stats': dashboard,
+        'complaints': complaints_by_mess
+    })
 
 # Include router
 app.include_router(api_router)
@@ -548,6 +2332,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Disposition", "ETag", "Last-Modified"],
 )
 
 logging.basicConfig(
@@ -556,6 +2341,210 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    queries = {'count': 0, 'seconds': 0.0, 'commands': {}}
+    request_queries.set(queries)
+    metrics.in_flight += 1
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.in_flight -= 1
+        # Label by route template, never the raw path, to keep series bounded
+        route = request.scope.get('route')
+        route_path = route.path if route else 'unmatched'
+        metrics.record_request(request.method, route_path, status, elapsed, queries)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            breakdown = ', '.join(f"{label} x{count}" for label, count in sorted(queries['commands'].items()))
+            logger.warning(
+                f"Slow request {request.method} {route_path} -> {status} in {elapsed * 1000:.0f}ms; "
+                f"{queries['count']} db commands in {queries['seconds'] * 1000:.0f}ms ({breakdown})"
+            )
+
+def render_metrics() -> str:
+    lines = [
+        '# HELP http_requests_in_progress Requests currently being handled',
+        '# TYPE http_requests_in_progress gauge',
+        f'http_requests_in_progress {metrics.in_flight}',
+        '# HELP http_requests_total Requests handled, by route template and status',
+        '# TYPE http_requests_total counter',
+    ]
+    with metrics.lock:
+        for (method, route, status), count in sorted(metrics.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        lines += [
+            '# HELP http_request_duration_seconds Request latency, by route template',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), histogram in sorted(metrics.latency.items()):
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+        lines += [
+            '# HELP http_request_db_commands_total MongoDB commands issued while handling requests, by route template',
+            '# TYPE http_request_db_commands_total counter',
+        ]
+        for (method, route), (count, _) in sorted(metrics.route_db.items()):
+            lines.append(f'http_request_db_commands_total{{method="{method}",route="{route}"}} {count}')
+        lines += [
+            '# HELP http_request_db_seconds_total Time spent in MongoDB commands while handling requests, by route template',
+            '# TYPE http_request_db_seconds_total counter',
+        ]
+        for (method, route), (_, seconds) in sorted(metrics.route_db.items()):
+            lines.append(f'http_request_db_seconds_total{{method="{method}",route="{route}"}} {seconds:.6f}')
+        lines += [
+            '# HELP mongodb_commands_total MongoDB commands, by command name',
+            '# TYPE mongodb_commands_total counter',
+        ]
+        for name, (count, _, _) in sorted(metrics.commands.items()):
+            lines.append(f'mongodb_commands_total{{command="{name}"}} {count}')
+        lines += [
+            '# HELP mongodb_command_failures_total Failed MongoDB commands, by command name',
+            '# TYPE mongodb_command_failures_total counter',
+        ]
+        for name, (_, _, failures) in sorted(metrics.commands.items()):
+            lines.append(f'mongodb_command_failures_total{{command="{name}"}} {failures}')
+        lines += [
+            '# HELP mongodb_command_seconds_total Time spent in MongoDB commands, by command name',
+            '# TYPE mongodb_command_seconds_total counter',
+        ]
+        for name, (_, seconds, _) in sorted(metrics.commands.items()):
+            lines.append(f'mongodb_command_seconds_total{{command="{name}"}} {seconds:.6f}')
+    lines += [
+        '# HELP rate_limit_requests_total Auth requests checked by the rate limiter, by bucket and result',
+        '# TYPE rate_limit_requests_total counter',
+    ]
+    for name, counts in rate_limit_stats.items():
+        for result, count in counts.items():
+            lines.append(f'rate_limit_requests_total{{bucket="{name}",result="{result}"}} {count}')
+    caches = {'users': user_cache.stats(), 'tokens': token_cache.stats(), 'responses': response_cache.stats(), 'menus': menu_cache.stats()}
+    for metric, kind, help_text in (
+        ('hits', 'counter', 'Cache hits'),
+        ('misses', 'counter', 'Cache misses'),
+        ('size', 'gauge', 'Entries currently cached'),
+    ):
+        name = f'cache_{metric}_total' if kind == 'counter' else f'cache_{metric}'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for cache_name, stats in caches.items():
+            if metric in stats:
+                lines.append(f'{name}{{cache="{cache_name}"}} {stats[metric]}')
+    return '\n'.join(lines) + '\n'
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    token = os.environ.get('METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
+
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_background_workers():
+    app.state.workers = []
+    if os.environ.get('EMAIL_WORKER_ENABLED', 'true').lower() == 'true':
+        app.state.workers.append(asyncio.create_task(run_email_worker()))
+    if os.environ.get('SUBSCRIPTION_SWEEP_ENABLED', 'true').lower() == 'true':
+        app.state.workers.append(asyncio.create_task(run_subscription_sweeper()))
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for worker in getattr(app.state, 'workers', []):
+        worker.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+async def _audit_indexes_command() -> int:
+    report = await audit_query_plans()
+    for entry in report:
+        status = 'MISSING' if entry['missing'] else 'COLLSCAN' if entry['collscan'] else 'ok'
+        print(f"{status:8} {entry['collection']}: {entry['query']} -> {' > '.join(entry['stages'])}")
+    return 1 if any(entry['collscan'] or entry['missing'] for entry in report) else 0
+
+async def _ensure_indexes_command() -> int:
+    await ensure_indexes()
+    return 0
+
+async def _backfill_search_keys_command() -> int:
+    updates = []
+    async for mess in db.messes.find({'city_key': {'$exists': False}}, {'_id': 0, 'id': 1, 'city': 1, 'state': 1}):
+        updates.append(UpdateOne({'id': mess['id']}, {'$set': {
+            'city_key': normalize_location(mess.get('city', '')),
+            'state_key': normalize_location(mess.get('state', ''))
+        }}))
+        if len(updates) == 1000:
+            await db.messes.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.messes.bulk_write(updates, ordered=False)
+    return 0
+
+async def _reconcile_ratings_command() -> int:
+    count = await reconcile_rating_counters()
+    print(f"Reconciled rating counters for {count} messes")
+    return 0
+
+async def _reconcile_owner_stats_command() -> int:
+    stats = await rebuild_owner_stats()
+    print(f"Rebuilt dashboard stats for {len(stats)} owners")
+    return 0
+
+async def _reconcile_headcounts_command() -> int:
+    count = await rebuild_meal_headcounts()
+    print(f"Rebuilt {count} meal headcount counters")
+    return 0
+
+async def _migrate_subscription_dates_command() -> int:
+    count = await migrate_subscription_dates()
+    print(f"Converted dates on {count} subscriptions")
+    return 0
+
+async def _expire_subscriptions_command() -> int:
+    count = await expire_subscriptions()
+    print(f"Expired {count} subscriptions")
+    return 0
+
+async def _migrate_menus_command() -> int:
+    count = await migrate_menus()
+    print(f"Moved menus out of {count} mess documents")
+    return 0
+
+async def _reconcile_rollups_command() -> int:
+    count = await rebuild_mess_rollups()
+    print(f"Rebuilt {count} complaint/rating rollups")
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    commands = {
+        'ensure-indexes': _ensure_indexes_command,
+        'audit-indexes': _audit_indexes_command,
+        'backfill-search-keys': _backfill_search_keys_command,
+        'reconcile-ratings': _reconcile_ratings_command,
+        'reconcile-owner-stats': _reconcile_owner_stats_command,
+        'reconcile-headcounts': _reconcile_headcounts_command,
+        'migrate-subscription-dates': _migrate_subscription_dates_command,
+        'expire-subscriptions': _expire_subscriptions_command,
+        'migrate-menus': _migrate_menus_command,
+        'reconcile-rollups': _reconcile_rollups_command,
+    }
+    parser = argparse.ArgumentParser(description='Smart Mess maintenance commands')
+    parser.add_argument('command', choices=sorted(commands))
+    args = parser.parse_args()
+    sys.exit(asyncio.run(commands[args.command]()))
@@ -16,6 +16,7 @@ function OwnerDashboard({ user }) {
   const [messes, setMesses] = useState([]);
   const [stats, setStats] = useState(null);
   const [complaints, setComplaints] = useState([]);
+  const [complaintsByMess, setComplaintsByMess] = useState({});
   const [loading, setLoading] = useState(true);
   const [createDialog, setCreateDialog] = useState(false);
   const [menuDialog, setMenuDialog] = useState(false);
@@ -42,18 +43,19 @@ function OwnerDashboard({ user }) {
   ]);
 
   useEffect(() => {
-    fetchMesses();
-    fetchStats();
+    fetchHome();
   }, []);
 
-  const fetchMesses = async () => {
+  const fetchHome = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/mess/owner/my-messes`, {
+      const response = await fetch(`${API}/owner/home`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setMesses(data);
+      setMesses(data.messes);
+      setStats(data.stats);
+      setComplaintsByMess(data.complaints);
     } catch (error) {
       toast.error('Failed to fetch messes');
     } finally {
@@ -61,29 +63,31 @@ function OwnerDashboard({ user }) {
     }
   };
 
-  const fetchStats = async () => {
+  const fetchMesses = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/owner/dashboard-stats`, {
+      const response = await fetch(`${API}/mess/owner/my-messes`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setStats(data);
+      setMesses(data);
     } catch (error) {
-      console.error('Failed to fetch stats');
+      toast.error('Failed to fetch messes');
+    } finally {
+      setLoading(false);
     }
   };
 
-  const fetchComplaints = async (messId) => {
+  const fetchStats = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/complaint/mess/${messId}`, {
+      const response = await fetch(`${API}/owner/dashboard-stats`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setComplaints(data);
+      setStats(data);
     } catch (error) {
-      console.error('Failed to fetch complaints');
+      console.error('Failed to fetch stats');
     }
   };
 
@@ -395,7 +399,8 @@ function OwnerDashboard({ user }) {
                         variant="outline"
                         onClick={() => {
                           setSelectedMess(mess);
-                          fetchComplaints(mess.id);
+                          // Loaded grouped by mess with /owner/home; a mess created since has none yet
+                          setComplaints(complaintsByMess[mess.id] || []);
                         }}
                         data-testid={`view-complaints-btn-${mess.id}`}
                       >
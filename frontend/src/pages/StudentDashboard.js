@@ -20,18 +20,18 @@ function StudentDashboard({ user }) {
   const [skipData, setSkipData] = useState({ date: '', mealType: 'breakfast' });
 
   useEffect(() => {
-    fetchSubscriptions();
-    fetchComplaints();
+    fetchHome();
   }, []);
 
-  const fetchSubscriptions = async () => {
+  const fetchHome = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/subscription/my-subscriptions`, {
+      const response = await fetch(`${API}/student/home`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setSubscriptions(data);
+      setSubscriptions(data.subscriptions);
+      setComplaints(data.complaints);
     } catch (error) {
       toast.error('Failed to fetch subscriptions');
     } finally {
@@ -39,16 +39,18 @@ function StudentDashboard({ user }) {
     }
   };
 
-  const fetchComplaints = async () => {
+  const fetchSubscriptions = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API}/complaint/my-complaints`, {
+      const response = await fetch(`${API}/subscription/my-subscriptions`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await response.json();
-      setComplaints(data);
+      setSubscriptions(data);
     } catch (error) {
-      console.error('Failed to fetch complaints');
+      toast.error('Failed to fetch subscriptions');
+    } finally {
+      setLoading(false);
     }
   };
 
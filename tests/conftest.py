@@ -0,0 +1,64 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# server reads its configuration at import time: run offline, without background workers
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'smart_mess_test')
+os.environ['PAYMENT_GATEWAY'] = 'fake'
+os.environ['EMAIL_TRANSPORT'] = 'log'
+os.environ['EMAIL_WORKER_ENABLED'] = 'false'
+os.environ['SUBSCRIPTION_SWEEP_ENABLED'] = 'false'
+for limit in ('RATE_LIMIT_LOGIN_IP', 'RATE_LIMIT_LOGIN_EMAIL', 'RATE_LIMIT_SIGNUP_IP'):
+    os.environ[limit] = '100000/second'
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    server.client = AsyncMongoMockClient(tz_aware=True)
+    server.db = server.client['smart_mess_test']
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def signup(client, name, role):
+    response = client.post('/api/auth/signup', json={
+        'name': name, 'email': f'{name}@example.com', 'password': 'password123', 'role': role
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return {'Authorization': f"Bearer {body['token']}"}, body['user']
+
+
+@pytest.fixture
+def owner(client):
+    return signup(client, 'owner', 'owner')
+
+
+@pytest.fixture
+def student(client):
+    return signup(client, 'student', 'student')
+
+
+@pytest.fixture
+def mess(client, owner):
+    headers, _ = owner
+    response = client.post('/api/mess', headers=headers, json={
+        'name': 'Annapurna Mess', 'address': '12 FC Road', 'city': 'Pune', 'state': 'Maharashtra',
+        'mess_type': 'both', 'contact_number': '9000000000', 'pricing_monthly': 3000, 'pricing_weekly': 800
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def run(client, coroutine_function, *args):
+    # Runs a coroutine on the app's event loop, e.g. to inspect the database
+    return client.portal.call(coroutine_function, *args)
@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from .conftest import run, signup
+
+
+def listed_emails(client, headers, **params):
+    response = client.get('/api/admin/users', headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return {user['email'] for user in response.json()}
+
+
+def test_created_bounds_with_offsets_are_compared_in_utc(client):
+    before = datetime.now(timezone.utc) - timedelta(minutes=1)
+    headers, _ = signup(client, 'admin', 'admin')
+    signup(client, 'student', 'student')
+    
+    ist = timezone(timedelta(hours=5, minutes=30))
+    assert len(listed_emails(client, headers, created_from=before.astimezone(ist).isoformat())) == 2
+    assert len(listed_emails(client, headers, created_from=before.strftime('%Y-%m-%dT%H:%M:%SZ'))) == 2
+    assert listed_emails(client, headers, created_to=before.astimezone(ist).isoformat()) == set()
+    
+    today = server.local_today()
+    assert len(listed_emails(client, headers, created_from=today.isoformat())) == 2
+    assert listed_emails(client, headers, created_from=(today + timedelta(days=1)).isoformat()) == set()
+    
+    assert client.get('/api/admin/users', headers=headers, params={'created_from': 'yesterday'}).status_code == 400
+
+
+def test_export_uses_the_same_bounds(client):
+    headers, _ = signup(client, 'admin', 'admin')
+    tomorrow = (server.local_today() + timedelta(days=1)).isoformat()
+    response = client.get('/api/admin/export/users', headers=headers, params={'format': 'ndjson', 'created_to': tomorrow})
+    assert len(response.text.splitlines()) == 1
+    response = client.get('/api/admin/export/users', headers=headers, params={'format': 'ndjson', 'created_from': tomorrow})
+    assert response.text == ''
+
+
+def test_cursor_pages_neither_skip_nor_repeat(client):
+    headers, _ = signup(client, 'admin', 'admin')
+    # Ties on created_at are broken by id
+    created_at = datetime.now(timezone.utc).isoformat()
+    run(client, server.db.users.insert_many, [
+        {'id': f'user-{index:02d}', 'name': f'User {index}', 'email': f'user{index}@example.com', 'role': 'student',
+         'password': 'x', 'is_verified': False, 'created_at': created_at if index % 2 else f'2025-01-0{index % 9 + 1}T00:00:00+00:00'}
+        for index in range(11)
+    ])
+    seen = []
+    cursor = None
+    while True:
+        params = {'role': 'student', 'limit': 3}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/api/admin/users', headers=headers, params=params)
+        seen += [user['id'] for user in response.json()]
+        cursor = response.headers.get('x-next-cursor')
+        if not cursor:
+            break
+    assert sorted(seen) == [f'user-{index:02d}' for index in range(11)]
+
+
+def test_prefix_search_pages_through_summary_view(client):
+    # Typeahead sorts on city_key, which the summary projection does not return
+    run(client, server.db.messes.insert_many, [
+        {'id': f'mess-{index}', 'name': f'Mess {index}', 'city': 'Pune', 'state': 'Maharashtra',
+         'city_key': 'pune', 'state_key': 'maharashtra', 'is_verified': True, 'rating': 0.0}
+        for index in range(5)
+    ])
+    for view in ('summary', 'full'):
+        seen = []
+        cursor = None
+        while True:
+            params = {'city': 'Pu', 'prefix': True, 'view': view, 'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = client.get('/api/mess/search', params=params)
+            assert response.status_code == 200, response.text
+            seen += [mess['id'] for mess in response.json()]
+            cursor = response.headers.get('x-next-cursor')
+            if not cursor:
+                break
+        assert seen == [f'mess-{index}' for index in range(5)], view
+
+
+@pytest.mark.parametrize('raw', [
+    ['$ne', 'x'],
+    [{'$where': 'sleep(1000)'}, 'x'],
+    ['2025-01-01', {'$gt': ''}],
+    [None],
+])
+def test_crafted_cursors_are_rejected(client, raw):
+    cursor = base64.urlsafe_b64encode(json.dumps(raw).encode('utf-8')).decode('utf-8')
+    response = client.get('/api/mess/search', params={'city': 'Pune', 'cursor': cursor})
+    # ['$ne', 'x'] is a valid scalar cursor: it only compares as a string
+    assert response.status_code == (200 if raw[0] == '$ne' else 400)
+    response = client.get('/api/mess/search', params={'lat': 18.5, 'lng': 73.8, 'cursor': cursor})
+    assert response.status_code == 400
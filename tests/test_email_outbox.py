@@ -0,0 +1,44 @@
+import json
+from datetime import datetime, timezone
+
+import server
+from .conftest import run
+
+
+def test_duplicate_events_are_queued_once(client):
+    for _ in range(2):
+        run(client, server.enqueue_email, 'owner@example.com', 'Mess Verified', '<p>Live</p>', 'mess-verified:1')
+    assert run(client, server.db.email_outbox.count_documents, {}) == 1
+
+
+def test_batch_is_delivered_through_the_transport(client, monkeypatch, tmp_path):
+    outbox_file = tmp_path / 'outbox.jsonl'
+    monkeypatch.setattr(server, 'email_transport', server.FileTransport(str(outbox_file)))
+    run(client, server.enqueue_email, 'student@example.com', 'Subscription Confirmed', '<p>Welcome</p>')
+    assert run(client, server.drain_email_outbox) == 1
+    
+    message = run(client, server.db.email_outbox.find_one, {})
+    assert message['status'] == 'sent' and 'claim' not in message
+    assert json.loads(outbox_file.read_text())['to'] == 'student@example.com'
+
+
+def test_transport_exception_backs_off_then_fails(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'email_transport', server.FileTransport(str(tmp_path / 'missing' / 'outbox.jsonl')))
+    run(client, server.enqueue_email, 'student@example.com', 'Subscription Confirmed', '<p>Welcome</p>')
+    assert run(client, server.drain_email_outbox) == 1
+    
+    message = run(client, server.db.email_outbox.find_one, {})
+    assert message['status'] == 'pending' and message['attempts'] == 1
+    assert message['last_error'].startswith('FileNotFoundError')
+    assert message['next_attempt_at'] > datetime.now(timezone.utc).isoformat()
+    # Backing off: not claimed again straight away
+    assert run(client, server.drain_email_outbox) == 0
+    
+    # The last allowed attempt marks it failed
+    run(client, server.db.email_outbox.update_one, {'id': message['id']}, {'$set': {
+        'attempts': server.EMAIL_MAX_ATTEMPTS - 1,
+        'next_attempt_at': datetime.now(timezone.utc).isoformat()
+    }})
+    assert run(client, server.drain_email_outbox) == 1
+    message = run(client, server.db.email_outbox.find_one, {})
+    assert message['status'] == 'failed' and message['attempts'] == server.EMAIL_MAX_ATTEMPTS
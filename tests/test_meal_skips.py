@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import server
+from .conftest import run
+
+
+def subscribe(client, headers, mess_id, plan_type='weekly'):
+    today = server.local_today()
+    start = datetime(today.year, today.month, today.day, tzinfo=server.MESS_TIMEZONE)
+    response = client.post(
+        '/api/subscription/verify-payment',
+        headers=headers,
+        params={'payment_id': 'pay_1', 'order_id': 'order_1', 'signature': server.payment_gateway.sign('order_1', 'pay_1')},
+        json={'mess_id': mess_id, 'plan_type': plan_type, 'start_date': start.isoformat()}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_bulk_skip_reports_duplicates_as_already_skipped(client, owner, student, mess):
+    headers, _ = student
+    subscription = subscribe(client, headers, mess['id'])
+    today = server.local_today()
+    body = {
+        'subscription_id': subscription['id'],
+        'start_date': (today + timedelta(days=1)).isoformat(),
+        'end_date': (today + timedelta(days=3)).isoformat(),
+        'meal_types': ['lunch', 'dinner']
+    }
+    first = client.post('/api/subscription/skip-meals', headers=headers, json=body).json()
+    assert first['skipped'] == 6
+    assert {result['status'] for result in first['results']} == {'skipped'}
+    
+    second = client.post('/api/subscription/skip-meals', headers=headers, json=body).json()
+    assert second['skipped'] == 0
+    assert {result['status'] for result in second['results']} == {'already_skipped'}
+    assert run(client, server.db.meal_skips.count_documents, {}) == 6
+    
+    # The headcount only dropped once per meal
+    owner_headers, _ = owner
+    day = (today + timedelta(days=2)).isoformat()
+    headcount = client.get(f"/api/mess/{mess['id']}/headcount", headers=owner_headers, params={'date': day}).json()
+    assert headcount['date'] == day
+    assert headcount['meals'] == {'breakfast': 1, 'lunch': 0, 'dinner': 0}
+    invalid = client.get(f"/api/mess/{mess['id']}/headcount", headers=owner_headers, params={'date': 'tomorrow'})
+    assert invalid.status_code == 400
+
+
+def test_bulk_skip_outside_subscription_is_not_recorded(client, student, mess):
+    headers, _ = student
+    subscription = subscribe(client, headers, mess['id'])
+    today = server.local_today()
+    body = {
+        'subscription_id': subscription['id'],
+        'start_date': (today + timedelta(days=6)).isoformat(),
+        'end_date': (today + timedelta(days=8)).isoformat(),
+        'meal_types': ['lunch']
+    }
+    statuses = {result['date']: result['status'] for result in client.post('/api/subscription/skip-meals', headers=headers, json=body).json()['results']}
+    assert statuses[(today + timedelta(days=6)).isoformat()] == 'skipped'
+    assert statuses[(today + timedelta(days=7)).isoformat()] == 'not_subscribed'
+    assert run(client, server.db.meal_skips.count_documents, {}) == 1
@@ -0,0 +1,29 @@
+import server
+from .conftest import run
+
+WEEK = [{'day': day, 'breakfast': 'Poha', 'lunch': 'Thali', 'dinner': 'Khichdi'}
+        for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')]
+
+
+def test_menu_updates_create_versions(client, owner, mess):
+    headers, _ = owner
+    assert client.put(f"/api/mess/{mess['id']}/menu", headers=headers, json={'menu': WEEK}).json()['version'] == 1
+    assert client.put(f"/api/mess/{mess['id']}/menu", headers=headers, json={'menu': WEEK[:1]}).json()['version'] == 2
+    assert client.get(f"/api/mess/{mess['id']}").json()['menu'] == WEEK[:1]
+    assert client.get(f"/api/mess/{mess['id']}/menu/1").json()['menu'] == WEEK
+
+
+def test_menu_update_recovers_from_unmoved_pointer(client, owner, mess):
+    # A previous update inserted version 1 but died before moving messes.menu_version
+    run(client, server.db.menus.insert_one, {
+        'id': 'orphan', 'mess_id': mess['id'], 'version': 1, 'menu': WEEK,
+        'created_by': mess['owner_id'], 'created_at': mess['created_at']
+    })
+    headers, _ = owner
+    for expected in (2, 3):
+        response = client.put(f"/api/mess/{mess['id']}/menu", headers=headers, json={'menu': WEEK[:expected]})
+        assert response.status_code == 200, response.text
+        assert response.json()['version'] == expected
+    stored = run(client, server.db.messes.find_one, {'id': mess['id']})
+    assert stored['menu_version'] == 3
+    assert client.get(f"/api/mess/{mess['id']}/menu").json()['menu'] == WEEK[:3]
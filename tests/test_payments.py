@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import server
+from .conftest import run, signup
+
+
+def verify(client, headers, mess_id, order_id, payment_id, signature=None):
+    start = datetime.now(server.MESS_TIMEZONE) + timedelta(days=1)
+    return client.post(
+        '/api/subscription/verify-payment',
+        headers=headers,
+        params={
+            'payment_id': payment_id,
+            'order_id': order_id,
+            'signature': signature or server.payment_gateway.sign(order_id, payment_id)
+        },
+        json={'mess_id': mess_id, 'plan_type': 'monthly', 'start_date': start.isoformat()}
+    )
+
+
+def test_fake_gateway_creates_orders_in_paise(client, student):
+    headers, _ = student
+    response = client.post('/api/subscription/create-order', headers=headers, json={'amount': 3000, 'subscription_data': {}})
+    assert response.status_code == 200
+    assert response.json()['amount'] == 300000
+
+
+def test_retried_verification_returns_same_subscription(client, owner, student, mess):
+    owner_headers, _ = owner
+    # Materialize the owner's stats so the verifications below adjust them incrementally
+    assert client.get('/api/owner/dashboard-stats', headers=owner_headers).json()['active_subscriptions'] == 0
+    headers, _ = student
+    first = verify(client, headers, mess['id'], 'order_1', 'pay_1')
+    second = verify(client, headers, mess['id'], 'order_1', 'pay_1')
+    assert first.status_code == 200 and second.status_code == 200
+    assert second.json()['id'] == first.json()['id']
+    assert run(client, server.db.subscriptions.count_documents, {}) == 1
+    assert client.get('/api/owner/dashboard-stats', headers=owner_headers).json()['active_subscriptions'] == 1
+
+
+def test_payment_cannot_be_reused_by_another_student(client, student, mess):
+    headers, _ = student
+    assert verify(client, headers, mess['id'], 'order_1', 'pay_1').status_code == 200
+    other_headers, _ = signup(client, 'other', 'student')
+    assert verify(client, other_headers, mess['id'], 'order_1', 'pay_1').status_code == 409
+
+
+def test_bad_signature_is_rejected(client, student, mess):
+    headers, _ = student
+    response = verify(client, headers, mess['id'], 'order_1', 'pay_1', signature='forged')
+    assert response.status_code == 400
+    assert run(client, server.db.subscriptions.count_documents, {}) == 0
@@ -0,0 +1,30 @@
+import pytest
+
+import server
+from .conftest import run
+
+
+def rate(client, headers, mess_id, rating):
+    response = client.post('/api/rating', headers=headers, json={'mess_id': mess_id, 'rating': rating, 'review': ''})
+    assert response.status_code == 200, response.text
+
+
+def test_rating_updates_running_average(client, student, mess):
+    headers, _ = student
+    rate(client, headers, mess['id'], 4)
+    rate(client, headers, mess['id'], 5)
+    stored = run(client, server.db.messes.find_one, {'id': mess['id']})
+    assert stored['total_ratings'] == 2
+    assert stored['rating'] == pytest.approx(4.5)
+
+
+def test_rating_seeds_sum_on_messes_without_one(client, student, mess):
+    # Messes rated before rating_sum was stored only carry the average and the count
+    run(client, server.db.messes.update_one, {'id': mess['id']},
+        {'$set': {'rating': 4.0, 'total_ratings': 10}, '$unset': {'rating_sum': ''}})
+    headers, _ = student
+    rate(client, headers, mess['id'], 5)
+    stored = run(client, server.db.messes.find_one, {'id': mess['id']})
+    assert stored['rating_sum'] == pytest.approx(45)
+    assert stored['total_ratings'] == 11
+    assert stored['rating'] == pytest.approx(45 / 11)